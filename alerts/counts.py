@@ -0,0 +1,73 @@
+from collections import Counter
+
+# alert_counts holds one row per (hour, sensor, alert type) and alert_type_totals one row per
+# alert type, both written in the same transaction as the alerts they count
+lock_key = 7302
+
+async def create_tables(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS alert_counts (
+            bucket TIMESTAMP NOT NULL,
+            sensor_id VARCHAR(100) NOT NULL,
+            alert_type VARCHAR(50) NOT NULL,
+            count BIGINT NOT NULL,
+            PRIMARY KEY (bucket, sensor_id, alert_type)
+        )
+    """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_alert_counts_sensor ON alert_counts(sensor_id, bucket)
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS alert_type_totals (
+            alert_type VARCHAR(50) PRIMARY KEY,
+            count BIGINT NOT NULL
+        )
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS alert_counts_state (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            backfilled_at TIMESTAMP NOT NULL
+        )
+    """)
+    await backfill(conn)
+
+async def backfill(conn):
+    # counts the alerts written before the summary tables existed, once
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", lock_key)
+        if await conn.fetchval("SELECT EXISTS (SELECT 1 FROM alert_counts_state)"):
+            return
+        await conn.execute("LOCK TABLE alerts IN SHARE MODE")
+        await conn.execute("""
+            INSERT INTO alert_counts (bucket, sensor_id, alert_type, count)
+            SELECT date_trunc('hour', timestamp), sensor_id, alert_type, COUNT(*)
+            FROM alerts
+            GROUP BY 1, 2, 3
+        """)
+        await conn.execute("""
+            INSERT INTO alert_type_totals (alert_type, count)
+            SELECT alert_type, COUNT(*) FROM alerts GROUP BY alert_type
+        """)
+        await conn.execute("INSERT INTO alert_counts_state (backfilled_at) VALUES (CURRENT_TIMESTAMP)")
+
+async def record(conn, alerts):
+    buckets = Counter(
+        (alert["timestamp"].replace(minute=0, second=0, microsecond=0), alert["sensor_id"], alert["alert_type"])
+        for alert in alerts
+    )
+    totals = Counter(alert["alert_type"] for alert in alerts)
+    # rows are upserted in key order so concurrent workers lock them in the same order
+    keys = sorted(buckets)
+    await conn.execute("""
+        INSERT INTO alert_counts (bucket, sensor_id, alert_type, count)
+        SELECT * FROM unnest($1::timestamp[], $2::varchar[], $3::varchar[], $4::bigint[])
+        ON CONFLICT (bucket, sensor_id, alert_type)
+        DO UPDATE SET count = alert_counts.count + EXCLUDED.count
+    """, [key[0] for key in keys], [key[1] for key in keys], [key[2] for key in keys], [buckets[key] for key in keys])
+    types = sorted(totals)
+    await conn.execute("""
+        INSERT INTO alert_type_totals (alert_type, count)
+        SELECT * FROM unnest($1::varchar[], $2::bigint[])
+        ON CONFLICT (alert_type)
+        DO UPDATE SET count = alert_type_totals.count + EXCLUDED.count
+    """, types, [totals[alert_type] for alert_type in types])
@@ -0,0 +1,159 @@
+import time
+from bisect import bisect_left
+
+# minimal in-process metrics rendered in the prometheus text format. an observation is a
+# dict lookup plus a bisect over the bucket bounds, buckets are only made cumulative on render.
+
+latency_buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+size_buckets = [1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def empty_copy(self):
+        registry = Registry()
+        for metric in self.metrics:
+            metric.copy(registry)
+        return registry
+
+    def snapshot(self):
+        return {
+            metric.name: [[list(labels), value] for labels, value in metric.values.items()]
+            for metric in self.metrics
+        }
+
+    def merge(self, snapshot):
+        for metric in self.metrics:
+            for labels, value in snapshot.get(metric.name, []):
+                metric.merge(tuple(labels), value)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+        registry.metrics.append(self)
+
+    def copy(self, registry):
+        return type(self)(registry, self.name, self.help, self.labelnames)
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def merge(self, labels, value):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self):
+        return [f"{self.name}{format_labels(self.labelnames, labels)} {value}" for labels, value in self.values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def clear(self):
+        self.values.clear()
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=latency_buckets):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket with a trailing +Inf slot, sum, count]
+        self.values = {}
+        registry.metrics.append(self)
+
+    def copy(self, registry):
+        return Histogram(registry, self.name, self.help, self.labelnames, self.buckets)
+
+    def observe(self, value, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def merge(self, labels, value):
+        state = self.values.get(labels)
+        if state is None:
+            self.values[labels] = [list(value[0]), value[1], value[2]]
+            return
+        for i, count in enumerate(value[0]):
+            state[0][i] += count
+        state[1] += value[1]
+        state[2] += value[2]
+
+    def render(self):
+        lines = []
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ["+Inf"], counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class LatencyMiddleware:
+    # plain asgi rather than BaseHTTPMiddleware, which runs every request through an extra
+    # task and memory streams. observes the time until the response headers are sent.
+    def __init__(self, app, histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        observed = False
+
+        async def timed_send(message):
+            nonlocal observed
+            if message["type"] == "http.response.start" and not observed:
+                observed = True
+                self.observe(scope, started, message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        except Exception:
+            if not observed:
+                self.observe(scope, started, 500)
+            raise
+
+    def observe(self, scope, started, status):
+        # the router stores the matched route in the shared scope
+        route = scope.get("route")
+        self.histogram.observe(
+            time.perf_counter() - started,
+            scope["method"], route.path if route else "unmatched", str(status)
+        )
@@ -0,0 +1,97 @@
+import numpy as np
+
+scopes = ["default", "group", "sensor"]
+
+class RuleSet:
+    def __init__(self, metrics, default, sensor_rules):
+        self.metrics = metrics
+        # row 0 holds the defaults, every sensor with its own effective rules gets a row
+        self.index = {sensor_id: row + 1 for row, sensor_id in enumerate(sensor_rules)}
+        self.thresholds = np.vstack([default[0]] + [rule[0] for rule in sensor_rules.values()])
+        self.hysteresis = np.vstack([default[1]] + [rule[1] for rule in sensor_rules.values()])
+
+    def lookup(self, sensor_ids):
+        index = self.index
+        rows = [index.get(sensor_id, 0) for sensor_id in sensor_ids]
+        return self.thresholds[rows], self.hysteresis[rows]
+
+def apply_overrides(base, overrides, column):
+    thresholds, hysteresis = base[0].copy(), base[1].copy()
+    for row in overrides:
+        col = column[row["metric"]]
+        thresholds[col] = np.inf if row["threshold"] is None else row["threshold"]
+        if row["hysteresis"] is not None:
+            hysteresis[col] = row["hysteresis"]
+    return thresholds, hysteresis
+
+def compile_rules(metrics, fallback, fallback_hysteresis, rows, members):
+    column = {metric: col for col, metric in enumerate(metrics)}
+    default = (
+        np.array([fallback[metric] for metric in metrics], dtype=np.float64),
+        np.array([fallback_hysteresis[metric] for metric in metrics], dtype=np.float64)
+    )
+    default_rules = []
+    group_rules = {}
+    sensor_rules = {}
+
+    for row in rows:
+        if row["metric"] not in column:
+            continue
+        if row["scope"] == "default":
+            default_rules.append(row)
+        elif row["scope"] == "group":
+            group_rules.setdefault(row["target"], []).append(row)
+        elif row["scope"] == "sensor":
+            sensor_rules.setdefault(row["target"], []).append(row)
+
+    default = apply_overrides(default, default_rules, column)
+    groups = {
+        group_name: apply_overrides(default, overrides, column)
+        for group_name, overrides in group_rules.items()
+    }
+
+    sensors = {}
+    for sensor_id, group_name in members.items():
+        if group_name in groups:
+            sensors[sensor_id] = groups[group_name]
+    for sensor_id, overrides in sensor_rules.items():
+        sensors[sensor_id] = apply_overrides(sensors.get(sensor_id, default), overrides, column)
+
+    return RuleSet(metrics, default, sensors)
+
+async def create_tables(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS alert_rules (
+            id SERIAL PRIMARY KEY,
+            scope VARCHAR(10) NOT NULL,
+            target VARCHAR(100) NOT NULL DEFAULT '',
+            metric VARCHAR(20) NOT NULL,
+            threshold FLOAT,
+            hysteresis FLOAT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (scope, target, metric)
+        )
+    """)
+    await conn.execute("""
+        ALTER TABLE alert_rules ADD COLUMN IF NOT EXISTS hysteresis FLOAT
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS sensor_groups (
+            sensor_id VARCHAR(100) PRIMARY KEY,
+            group_name VARCHAR(100) NOT NULL
+        )
+    """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sensor_groups_group ON sensor_groups(group_name)
+    """)
+
+async def load_rules(conn, metrics, fallback, fallback_hysteresis):
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        rows = await conn.fetch("SELECT scope, target, metric, threshold, hysteresis FROM alert_rules")
+        groups = await conn.fetch("""
+            SELECT sensor_id, group_name FROM sensor_groups
+            WHERE group_name IN (SELECT target FROM alert_rules WHERE scope = 'group')
+        """)
+
+    members = {row["sensor_id"]: row["group_name"] for row in groups}
+    return compile_rules(metrics, fallback, fallback_hysteresis, rows, members)
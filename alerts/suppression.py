@@ -0,0 +1,150 @@
+import msgpack
+import numpy as np
+
+opened = "open"
+ongoing = "ongoing"
+resolved = "resolved"
+
+class AlertTracker:
+    def __init__(self, renotify_seconds):
+        self.renotify_seconds = renotify_seconds
+        # (sensor_id, metric column or windowed alert type) -> [opened_at, last_notified, occurrences since last notification, peak]
+        self.states = {}
+        self.active_sensors = {}
+        self.dirty = set()
+        # key -> state before the batch in progress touched it, see begin
+        self.undo = None
+
+    def begin(self):
+        # the worker writes a batch's alerts after evaluating it, if the write fails the
+        # batch is replayed and has to find the states it started from
+        self.undo = {}
+
+    def commit(self):
+        self.undo = None
+
+    def rollback(self):
+        for key, saved in self.undo.items():
+            sensor_id = key[0]
+            current = self.states.get(key)
+            if saved is None:
+                if current is not None:
+                    del self.states[key]
+                    if self.active_sensors[sensor_id] == 1:
+                        del self.active_sensors[sensor_id]
+                    else:
+                        self.active_sensors[sensor_id] -= 1
+            else:
+                if current is None:
+                    self.active_sensors[sensor_id] = self.active_sensors.get(sensor_id, 0) + 1
+                self.states[key] = saved
+            self.dirty.add(key)
+        self.undo = None
+
+    def touch(self, key):
+        if self.undo is not None and key not in self.undo:
+            state = self.states.get(key)
+            self.undo[key] = None if state is None else list(state)
+
+    def evaluate(self, sensor_ids, values, thresholds, hysteresis, now):
+        above = values > thresholds
+        below = values < thresholds - hysteresis
+        # a sensor can open and resolve within one batch, so rows below the band also count for
+        # sensors with a breach in an earlier row of the batch
+        first_above = {}
+        for row in np.flatnonzero(above.any(axis=1)).tolist():
+            first_above.setdefault(sensor_ids[row], row)
+        if self.active_sensors or first_above:
+            active = np.fromiter(
+                (
+                    sensor_id in self.active_sensors or first_above.get(sensor_id, row) < row
+                    for row, sensor_id in enumerate(sensor_ids)
+                ),
+                dtype=bool, count=len(sensor_ids)
+            )
+            candidates = above | (below & active[:, None])
+        else:
+            candidates = above
+
+        events = []
+        rows, cols = np.nonzero(candidates)
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            sensor_id = sensor_ids[row]
+            key = (sensor_id, col)
+            value = float(values[row, col])
+            self.touch(key)
+            state = self.states.get(key)
+
+            if above[row, col]:
+                if state is None:
+                    self.states[key] = [now, now, 0, value]
+                    self.active_sensors[sensor_id] = self.active_sensors.get(sensor_id, 0) + 1
+                    events.append((sensor_id, col, opened, value, float(thresholds[row, col]), 1))
+                else:
+                    state[2] += 1
+                    state[3] = max(state[3], value)
+                    if now - state[1] >= self.renotify_seconds:
+                        events.append((sensor_id, col, ongoing, state[3], float(thresholds[row, col]), state[2]))
+                        state[1] = now
+                        state[2] = 0
+                        state[3] = value
+                self.dirty.add(key)
+            elif state is not None:
+                del self.states[key]
+                if self.active_sensors[sensor_id] == 1:
+                    del self.active_sensors[sensor_id]
+                else:
+                    self.active_sensors[sensor_id] -= 1
+                events.append((sensor_id, col, resolved, value, float(thresholds[row, col] - hysteresis[row, col]), state[2]))
+                self.dirty.add(key)
+
+        return events
+
+    def update(self, sensor_id, key, breached, value, threshold, now):
+        # scalar variant for conditions that are already boolean, such as windowed rules
+        self.touch((sensor_id, key))
+        state = self.states.get((sensor_id, key))
+        if breached:
+            if state is None:
+                self.states[(sensor_id, key)] = [now, now, 0, value]
+                self.active_sensors[sensor_id] = self.active_sensors.get(sensor_id, 0) + 1
+                self.dirty.add((sensor_id, key))
+                return (sensor_id, key, opened, value, threshold, 1)
+            state[2] += 1
+            state[3] = max(state[3], value)
+            self.dirty.add((sensor_id, key))
+            if now - state[1] >= self.renotify_seconds:
+                event = (sensor_id, key, ongoing, state[3], threshold, state[2])
+                state[1] = now
+                state[2] = 0
+                state[3] = value
+                return event
+        elif state is not None:
+            del self.states[(sensor_id, key)]
+            if self.active_sensors[sensor_id] == 1:
+                del self.active_sensors[sensor_id]
+            else:
+                self.active_sensors[sensor_id] -= 1
+            self.dirty.add((sensor_id, key))
+            return (sensor_id, key, resolved, value, threshold, state[2])
+        return None
+
+    def checkpoint(self):
+        updates = {}
+        removed = []
+        for key in self.dirty:
+            field = f"{key[0]}|{key[1]}"
+            if key in self.states:
+                updates[field] = msgpack.packb(self.states[key])
+            else:
+                removed.append(field)
+        self.dirty.clear()
+        return updates, removed
+
+    def restore(self, entries):
+        for field, payload in entries.items():
+            sensor_id, col = field.decode().rsplit("|", 1)
+            key = (sensor_id, int(col) if col.isdigit() else col)
+            if key not in self.states:
+                self.active_sensors[sensor_id] = self.active_sensors.get(sensor_id, 0) + 1
+            self.states[key] = msgpack.unpackb(payload)
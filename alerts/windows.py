@@ -0,0 +1,299 @@
+from array import array
+from datetime import datetime
+
+rule_types = ["moving_average", "rate_of_change", "count_over", "stuck"]
+
+# every tracked sensor costs capacity * (1 timestamp + 4 metrics) * 8 bytes for its ring,
+# e.g. 20 KiB at the default capacity of 512 readings, plus a few dozen bytes per rule.
+# a window that would hold more readings than the ring is cut down to the newest readings,
+# and readings that are not newer than the last one kept for the sensor are ignored, which
+# covers late data as well as stream entries replayed after the windows were rebuilt.
+
+class WindowRule:
+    __slots__ = ("alert_type", "col", "rule_type", "window", "threshold", "min_count")
+
+    def __init__(self, metric, col, rule_type, window, threshold, min_count):
+        self.alert_type = f"{metric}_{rule_type}"
+        self.col = col
+        self.rule_type = rule_type
+        self.window = window
+        self.threshold = threshold
+        self.min_count = min_count or 1
+
+class RuleState:
+    __slots__ = ("start", "total", "over", "reference", "changed_at")
+
+    def __init__(self, start):
+        self.start = start
+        self.total = 0.0
+        self.over = 0
+        self.reference = None
+        self.changed_at = None
+
+class SensorWindow:
+    def __init__(self, capacity, metric_count, rules):
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.values = [array("d", bytes(8 * capacity)) for col in range(metric_count)]
+        self.count = 0
+        self.saved = None
+        self.set_rules(rules)
+
+    def set_rules(self, rules):
+        self.rules = rules
+        first = max(0, self.count - self.capacity)
+        self.states = [RuleState(first) for rule in rules]
+        # rebuild the running aggregates of the new rules from what is still in the ring
+        for seq in range(first, self.count):
+            slot = seq % self.capacity
+            for rule, state in zip(self.rules, self.states):
+                self.add(rule, state, seq, self.timestamps[slot], self.values[rule.col][slot])
+
+    def save(self):
+        # enough to undo the pushes that follow, the slots they overwrite are added as they go
+        states = [(state.start, state.total, state.over, state.reference, state.changed_at) for state in self.states]
+        self.saved = (self.count, self.rules, states, {})
+
+    def restore(self):
+        count, rules, states, slots = self.saved
+        self.saved = None
+        for slot, (ts, row) in slots.items():
+            self.timestamps[slot] = ts
+            for col, value in enumerate(row):
+                self.values[col][slot] = value
+        self.count = count
+        if rules is self.rules:
+            for state, (start, total, over, reference, changed_at) in zip(self.states, states):
+                state.start = start
+                state.total = total
+                state.over = over
+                state.reference = reference
+                state.changed_at = changed_at
+        else:
+            # the rules were reloaded in the meantime, their states are rebuilt from the ring
+            self.set_rules(self.rules)
+
+    def evict(self, rule, state):
+        value = self.values[rule.col][state.start % self.capacity]
+        if rule.rule_type == "moving_average":
+            state.total -= value
+        elif rule.rule_type == "count_over" and value > rule.threshold:
+            state.over -= 1
+        state.start += 1
+
+    def add(self, rule, state, seq, ts, value):
+        if rule.rule_type == "stuck":
+            if state.reference is None or abs(value - state.reference) > rule.threshold:
+                state.reference = value
+                state.changed_at = ts
+            return ts - state.changed_at
+
+        if state.start == seq:
+            state.total = 0.0
+            state.over = 0
+        if rule.rule_type == "moving_average":
+            state.total += value
+        elif rule.rule_type == "count_over" and value > rule.threshold:
+            state.over += 1
+
+        timestamps = self.timestamps
+        capacity = self.capacity
+        while state.start < seq and ts - timestamps[state.start % capacity] > rule.window:
+            self.evict(rule, state)
+
+        if rule.rule_type == "moving_average":
+            return state.total / (seq + 1 - state.start)
+        if rule.rule_type == "count_over":
+            return state.over
+        return value - self.values[rule.col][state.start % capacity]
+
+    def breached(self, rule, state, seq, observed):
+        if rule.rule_type == "moving_average":
+            return observed > rule.threshold
+        if rule.rule_type == "count_over":
+            return observed >= rule.min_count
+        if rule.rule_type == "stuck":
+            return observed >= rule.window
+        if state.start == seq:
+            return False
+        if rule.threshold >= 0:
+            return observed >= rule.threshold
+        return observed <= rule.threshold
+
+    def push(self, ts, row):
+        seq = self.count
+        if seq and ts <= self.timestamps[(seq - 1) % self.capacity]:
+            return []
+
+        for rule, state in zip(self.rules, self.states):
+            if state.start <= seq - self.capacity:
+                self.evict(rule, state)
+
+        slot = seq % self.capacity
+        if self.saved is not None and slot not in self.saved[3]:
+            self.saved[3][slot] = (self.timestamps[slot], [values[slot] for values in self.values])
+        self.timestamps[slot] = ts
+        for col, value in enumerate(row):
+            self.values[col][slot] = value
+        self.count += 1
+
+        results = []
+        for rule, state in zip(self.rules, self.states):
+            observed = self.add(rule, state, seq, ts, row[rule.col])
+            results.append((rule, self.breached(rule, state, seq, observed), observed))
+        return results
+
+class WindowStore:
+    def __init__(self, metrics, capacity):
+        self.metrics = metrics
+        self.capacity = capacity
+        self.default = []
+        self.by_sensor = {}
+        self.sensors = {}
+        # sensor_id -> window as it was before the batch in progress, None if the batch created it
+        self.touched = None
+
+    def begin(self):
+        self.touched = {}
+
+    def commit(self):
+        for window in self.touched.values():
+            if window is not None:
+                window.saved = None
+        self.touched = None
+
+    def rollback(self):
+        for sensor_id, window in self.touched.items():
+            if window is None:
+                self.sensors.pop(sensor_id, None)
+            elif self.sensors.get(sensor_id) is window:
+                window.restore()
+        self.touched = None
+
+    def rules_for(self, sensor_id):
+        return self.by_sensor.get(sensor_id, self.default)
+
+    def has_rules(self):
+        return bool(self.default or self.by_sensor)
+
+    def max_window(self):
+        windows = [rule.window for rule in self.default]
+        for rules in self.by_sensor.values():
+            windows.extend(rule.window for rule in rules)
+        return max(windows, default=0)
+
+    def set_rules(self, default, by_sensor):
+        self.default = default
+        self.by_sensor = by_sensor
+        for sensor_id in list(self.sensors):
+            rules = self.rules_for(sensor_id)
+            if rules:
+                self.sensors[sensor_id].set_rules(rules)
+            else:
+                del self.sensors[sensor_id]
+
+    def push(self, sensor_id, ts, row):
+        window = self.sensors.get(sensor_id)
+        if window is None:
+            rules = self.rules_for(sensor_id)
+            if not rules:
+                return []
+            window = self.sensors[sensor_id] = SensorWindow(self.capacity, len(self.metrics), rules)
+            if self.touched is not None:
+                self.touched[sensor_id] = None
+        elif self.touched is not None and sensor_id not in self.touched:
+            window.save()
+            self.touched[sensor_id] = window
+        return window.push(ts, row)
+
+    def memory(self):
+        ring_bytes = (len(self.metrics) + 1) * 8 * self.capacity
+        return {
+            "sensors": len(self.sensors),
+            "capacity": self.capacity,
+            "bytes_per_sensor": ring_bytes,
+            "total_bytes": ring_bytes * len(self.sensors)
+        }
+
+def compile_window_rules(metrics, rows, members):
+    column = {metric: col for col, metric in enumerate(metrics)}
+    default = {}
+    groups = {}
+    sensors = {}
+
+    for row in rows:
+        if row["metric"] not in column or row["rule_type"] not in rule_types:
+            continue
+        rule = WindowRule(
+            row["metric"], column[row["metric"]], row["rule_type"],
+            row["window_seconds"], row["threshold"], row["min_count"]
+        )
+        if row["scope"] == "default":
+            default[rule.alert_type] = rule
+        elif row["scope"] == "group":
+            groups.setdefault(row["target"], {})[rule.alert_type] = rule
+        elif row["scope"] == "sensor":
+            sensors.setdefault(row["target"], {})[rule.alert_type] = rule
+
+    by_sensor = {}
+    for sensor_id, group_name in members.items():
+        if group_name in groups:
+            by_sensor[sensor_id] = {**default, **groups[group_name]}
+    for sensor_id, rules in sensors.items():
+        by_sensor[sensor_id] = {**by_sensor.get(sensor_id, default), **rules}
+
+    return list(default.values()), {sensor_id: list(rules.values()) for sensor_id, rules in by_sensor.items()}
+
+async def create_table(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS alert_window_rules (
+            id SERIAL PRIMARY KEY,
+            scope VARCHAR(10) NOT NULL,
+            target VARCHAR(100) NOT NULL DEFAULT '',
+            metric VARCHAR(20) NOT NULL,
+            rule_type VARCHAR(20) NOT NULL,
+            window_seconds INTEGER NOT NULL,
+            threshold FLOAT NOT NULL,
+            min_count INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (scope, target, metric, rule_type)
+        )
+    """)
+
+async def load_rules(conn, metrics):
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        rows = await conn.fetch("""
+            SELECT scope, target, metric, rule_type, window_seconds, threshold, min_count
+            FROM alert_window_rules
+        """)
+        groups = await conn.fetch("""
+            SELECT sensor_id, group_name FROM sensor_groups
+            WHERE group_name IN (SELECT target FROM alert_window_rules WHERE scope = 'group')
+        """)
+
+    members = {row["sensor_id"]: row["group_name"] for row in groups}
+    return compile_window_rules(metrics, rows, members)
+
+async def rebuild(conn, store, now, condition=None, store_for=None):
+    # replays the last max window of readings into the rings without raising any alerts.
+    # store_for picks the store of each sensor when one query fills several with the same rules
+    since = datetime.fromtimestamp(now - store.max_window())
+    columns = ", ".join(store.metrics)
+    query = f"""
+        SELECT sensor_id, timestamp, {columns} FROM sensor_readings
+        WHERE timestamp >= $1 {{}}
+        ORDER BY sensor_id, timestamp, id
+    """
+    filters = f"AND {condition}" if condition else ""
+    if store.default:
+        query, args = query.format(filters), [since]
+    else:
+        query, args = query.format(f"{filters} AND sensor_id = ANY($2::varchar[])"), [since, list(store.by_sensor)]
+
+    count = 0
+    async with conn.transaction(readonly=True):
+        async for row in conn.cursor(query, *args, prefetch=2000):
+            target = store_for(row["sensor_id"]) if store_for else store
+            target.push(row["sensor_id"], row["timestamp"].timestamp(), [float(row[metric]) for metric in store.metrics])
+            count += 1
+    return count
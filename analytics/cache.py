@@ -0,0 +1,108 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+# sensor-data bumps these after every committed batch
+watermark_key = "ingest_watermark"
+watermark_sensors_key = "ingest_watermark:sensors"
+
+class ResultCache:
+    # results are reused while the ingest watermark they were computed at is unchanged, for at
+    # most ttl seconds since the window itself slides. under constant ingest the watermark moves
+    # on every batch, so results younger than grace seconds are reused regardless.
+    def __init__(self, max_entries, ttl, grace, redis_client=None, shared=False, prefix="analytics_cache"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.grace = grace
+        self.redis_client = redis_client
+        self.shared = shared and redis_client is not None
+        self.prefix = prefix
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.counts = {"hits": 0, "shared_hits": 0, "joined": 0, "misses": 0}
+
+    async def watermark(self, sensor_id=None):
+        if self.redis_client is None:
+            return None
+        try:
+            if sensor_id is None:
+                value = await self.redis_client.get(watermark_key)
+            else:
+                value = await self.redis_client.hget(watermark_sensors_key, sensor_id)
+        except Exception:
+            return None
+        return int(value) if value is not None else 0
+
+    def fresh(self, entry, watermark, now):
+        age = now - entry["stored_at"]
+        if age < self.grace:
+            return True
+        return entry["watermark"] == watermark and age < self.ttl
+
+    def lookup(self, key, watermark):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if not self.fresh(entry, watermark, time.time()):
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def store(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get(self, key, sensor_id, compute):
+        watermark = await self.watermark(sensor_id)
+        entry = self.lookup(key, watermark)
+        if entry is not None:
+            self.counts["hits"] += 1
+            return entry["value"]
+
+        # concurrent misses for the same key wait on a single computation
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.fill(key, watermark, compute))
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self.inflight.pop(key, None))
+        else:
+            self.counts["joined"] += 1
+        return await asyncio.shield(task)
+
+    async def fill(self, key, watermark, compute):
+        entry = await self.shared_lookup(key, watermark)
+        if entry is not None:
+            self.counts["shared_hits"] += 1
+        else:
+            self.counts["misses"] += 1
+            entry = {"watermark": watermark, "stored_at": time.time(), "value": await compute()}
+            await self.shared_store(key, entry)
+        self.store(key, entry)
+        return entry["value"]
+
+    async def shared_lookup(self, key, watermark):
+        if not self.shared:
+            return None
+        try:
+            raw = await self.redis_client.get(f"{self.prefix}:{key}")
+        except Exception:
+            return None
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        return entry if self.fresh(entry, watermark, time.time()) else None
+
+    async def shared_store(self, key, entry):
+        if not self.shared:
+            return
+        try:
+            await self.redis_client.set(f"{self.prefix}:{key}", json.dumps(entry), ex=max(1, int(self.ttl)))
+        except Exception as e:
+            print(f"error sharing cached result: {e}")
+
+    def stats(self):
+        return {"entries": len(self.entries), "inflight": len(self.inflight), **self.counts}
@@ -0,0 +1,25 @@
+import json
+import msgpack
+from datetime import datetime
+
+def unpack_message(payload):
+    sensor_id, timestamp, temperature, humidity, vibration, load = msgpack.unpackb(payload)
+    return {
+        "sensor_id": sensor_id,
+        "temperature": temperature,
+        "humidity": humidity,
+        "vibration": vibration,
+        "load": load,
+        "timestamp": datetime.fromtimestamp(timestamp / 1000)
+    }
+
+def decode_entry(fields):
+    if b"m" in fields:
+        return unpack_message(fields[b"m"])
+    return json.loads(fields[b"data"])
+
+def entry_timestamp(data):
+    timestamp = data["timestamp"]
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return timestamp.timestamp()
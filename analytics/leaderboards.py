@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+import rollups
+
+windows = [int(hours) for hours in os.getenv("ANALYTICS_LEADERBOARD_HOURS", "1,24,168").split(",") if hours]
+refresh_seconds = int(os.getenv("ANALYTICS_LEADERBOARD_SECONDS", "30"))
+lock_key = "leaderboard_lock"
+orders = ["avg", "max"]
+
+# for every window and metric, leaderboard:{hours}:{metric}:{order} is a sorted set of sensors
+# by windowed average or maximum and leaderboard:{hours}:{metric}:values holds "avg max" per
+# sensor for the response. one instance at a time rebuilds all of them from the rollups and
+# swaps them in with renames, so readers only ever see complete boards.
+
+def board_key(hours, metric, order):
+    return f"leaderboard:{hours}:{metric}:{order}"
+
+def values_key(hours, metric):
+    return f"leaderboard:{hours}:{metric}:values"
+
+def meta_key(hours):
+    return f"leaderboard:{hours}:meta"
+
+async def refresh(pool, client, hours):
+    started = time.time()
+    async with pool.acquire() as conn:
+        per_sensor = await rollups.aggregate(conn, datetime.now() - timedelta(hours=hours), group_by_sensor=True)
+
+    pipe = client.pipeline(transaction=True)
+    renames = []
+    for metric in rollups.metrics:
+        boards = {order: {} for order in orders}
+        values = {}
+        for sensor_id, stats in per_sensor.items():
+            if not stats["count"]:
+                continue
+            boards["avg"][sensor_id] = stats[metric]["avg"]
+            boards["max"][sensor_id] = stats[metric]["max"]
+            values[sensor_id] = f"{stats[metric]['avg']} {stats[metric]['max']}"
+        for order in orders:
+            key = board_key(hours, metric, order)
+            renames.append((f"{key}:next", key, boards[order]))
+        renames.append((f"{values_key(hours, metric)}:next", values_key(hours, metric), values))
+
+    for staging, key, members in renames:
+        pipe.delete(staging)
+        if members and key.endswith(":values"):
+            pipe.hset(staging, mapping=members)
+        elif members:
+            pipe.zadd(staging, members)
+        if members:
+            pipe.rename(staging, key)
+        else:
+            pipe.delete(key)
+    pipe.hset(meta_key(hours), "computed_at", started)
+    await pipe.execute()
+
+async def maintain(pool, client):
+    # the lock is never released, it expires after one interval so the fleet refreshes once per interval
+    while True:
+        try:
+            if await client.set(lock_key, os.getpid(), nx=True, px=refresh_seconds * 1000):
+                for hours in windows:
+                    await refresh(pool, client, hours)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"error refreshing leaderboards: {e}")
+        await asyncio.sleep(refresh_seconds)
+
+async def read(client, hours, metric, order, limit):
+    computed_at = await client.hget(meta_key(hours), "computed_at")
+    if computed_at is None:
+        return None
+    computed_at = float(computed_at)
+    if time.time() - computed_at > 3 * refresh_seconds:
+        return None
+
+    ranked = await client.zrevrange(board_key(hours, metric, order), 0, limit - 1)
+    values = await client.hmget(values_key(hours, metric), ranked) if ranked else []
+    result = []
+    for sensor_id, value in zip(ranked, values):
+        if value is None:
+            continue
+        average, maximum = value.split()
+        result.append({"sensor_id": sensor_id.decode(), "average": round(float(average), 2), "maximum": round(float(maximum), 2)})
+    return result, computed_at
@@ -0,0 +1,193 @@
+import time
+import numpy as np
+
+# every tracked sensor owns one row of fleet-wide arrays holding a ring of time buckets that
+# covers the horizon plus lead_seconds for readings stamped ahead of the local clock, readings
+# further ahead are skipped. a slot is only reused once its bucket left the horizon. a bucket
+# holds the count and the sum, min, max and sum of squares of each metric, so a sensor costs
+# slots * (2 + 4 * metrics) * 8 bytes, e.g. 26 KiB for 15 minutes of 5 second buckets. the
+# arrays are sized for the memory cap up front but only rows in use are touched, and one more
+# ring adds up the whole fleet as readings arrive.
+# windows are answered at bucket resolution: the bucket the window starts in is included whole.
+# a window over many sensors is reduced over all their rows at once, slots are the last axis so
+# only the slots the window spans are read.
+
+sum_stat, min_stat, max_stat, sumsq_stat = range(4)
+lead_seconds = 30
+
+def add(buckets, counts, values, rows, bucket, data):
+    # adds readings to the rings of the given rows, buckets and counts are (rows, slots) and
+    # values (rows, 4, metrics, slots). readings are within one ring length of each other, so
+    # the ones landing in the same slot share its bucket and an older bucket there is stale
+    slots = buckets.shape[1]
+    slot = bucket % slots
+    keys, first = np.unique(rows * slots + slot, return_index=True)
+    stale = buckets.reshape(-1)[keys] != bucket[first]
+    stale_rows, stale_slots = rows[first][stale], slot[first][stale]
+    buckets[stale_rows, stale_slots] = bucket[first][stale]
+    counts[stale_rows, stale_slots] = 0
+    values[stale_rows, sum_stat, :, stale_slots] = 0.0
+    values[stale_rows, min_stat, :, stale_slots] = np.inf
+    values[stale_rows, max_stat, :, stale_slots] = -np.inf
+    values[stale_rows, sumsq_stat, :, stale_slots] = 0.0
+
+    np.add.at(counts, (rows, slot), 1)
+    np.add.at(values, (rows, sum_stat, slice(None), slot), data)
+    np.minimum.at(values, (rows, min_stat, slice(None), slot), data)
+    np.maximum.at(values, (rows, max_stat, slice(None), slot), data)
+    np.add.at(values, (rows, sumsq_stat, slice(None), slot), data * data)
+
+def empty_totals(metric_count):
+    return np.array([[0.0], [np.inf], [-np.inf], [0.0]]).repeat(metric_count, axis=1)
+
+def reduce(buckets, counts, values, first, last):
+    # gives the count and the (4, metrics) totals of the buckets first to last for every row.
+    # the window wraps around the ring at most once, so it is read as one or two runs of slots
+    slots = buckets.shape[1]
+    start = first % slots
+    end = start + min(last - first + 1, slots)
+    total_counts = np.zeros(len(buckets), dtype=np.int64)
+    totals = np.tile(empty_totals(values.shape[2]), (len(buckets), 1, 1))
+    for lo, hi in [(start, min(end, slots)), (0, end - slots)]:
+        if lo >= hi:
+            continue
+        held = buckets[:, lo:hi]
+        inside = (held >= first) & (held <= last)
+        total_counts += np.where(inside, counts[:, lo:hi], 0).sum(axis=1)
+        inside = inside[:, np.newaxis, :]
+        part = values[:, :, :, lo:hi]
+        totals[:, sum_stat] += np.where(inside, part[:, sum_stat], 0.0).sum(axis=2)
+        np.minimum(totals[:, min_stat], np.where(inside, part[:, min_stat], np.inf).min(axis=2), out=totals[:, min_stat])
+        np.maximum(totals[:, max_stat], np.where(inside, part[:, max_stat], -np.inf).max(axis=2), out=totals[:, max_stat])
+        totals[:, sumsq_stat] += np.where(inside, part[:, sumsq_stat], 0.0).sum(axis=2)
+    return total_counts, totals
+
+class LiveStore:
+    def __init__(self, metrics, horizon_seconds, bucket_seconds, max_bytes):
+        self.metrics = metrics
+        self.bucket_seconds = bucket_seconds
+        self.horizon_slots = int(horizon_seconds // bucket_seconds) + 1
+        self.lead_slots = -(-lead_seconds // bucket_seconds)
+        self.slots = self.horizon_slots + self.lead_slots
+        self.horizon = (self.horizon_slots - 1) * bucket_seconds
+        self.sensor_bytes = self.slots * (2 + 4 * len(metrics)) * 8
+        self.max_bytes = max_bytes
+        self.max_sensors = max_bytes // self.sensor_bytes
+        # sensor_id -> row, row -> sensor_id (None once swept) and the rows free for reuse
+        self.sensors = {}
+        self.sensor_ids = []
+        self.free_rows = []
+        self.buckets = np.full((self.max_sensors, self.slots), -1, dtype=np.int64)
+        self.counts = np.zeros((self.max_sensors, self.slots), dtype=np.int64)
+        self.values = np.zeros((self.max_sensors, 4, len(metrics), self.slots))
+        self.newest = np.full(self.max_sensors, -1, dtype=np.int64)
+        self.fleet_buckets = np.full((1, self.slots), -1, dtype=np.int64)
+        self.fleet_counts = np.zeros((1, self.slots), dtype=np.int64)
+        self.fleet_values = np.zeros((1, 4, len(metrics), self.slots))
+        # sensors that could not be tracked because of the memory cap, and when that last happened
+        self.dropped = {}
+        self.last_drop = None
+        self.started_at = None
+        self.caught_up_at = None
+
+    def reset(self, now):
+        # after a gap in consumption only windows starting from now are complete
+        self.started_at = now
+        self.caught_up_at = None
+
+    def push(self, sensor_ids, timestamps, rows):
+        # adds a batch of readings, ones outside the horizon and lead or of sensors over the cap
+        # are skipped
+        current = int(time.time() // self.bucket_seconds)
+        buckets = (np.array(timestamps, dtype=np.float64) // self.bucket_seconds).astype(np.int64)
+        data = np.array(rows, dtype=np.float64).reshape(len(buckets), len(self.metrics))
+        indexes = np.full(len(buckets), -1, dtype=np.int64)
+        for position in np.flatnonzero((buckets > current - self.horizon_slots) & (buckets <= current + self.lead_slots)):
+            sensor_id = sensor_ids[position]
+            index = self.sensors.get(sensor_id)
+            if index is None:
+                if len(self.sensors) >= self.max_sensors:
+                    self.dropped[sensor_id] = self.last_drop = time.time()
+                    continue
+                if self.free_rows:
+                    index = self.free_rows.pop()
+                    self.sensor_ids[index] = sensor_id
+                else:
+                    index = len(self.sensor_ids)
+                    self.sensor_ids.append(sensor_id)
+                self.sensors[sensor_id] = index
+            indexes[position] = index
+
+        keep = indexes >= 0
+        indexes, buckets, data = indexes[keep], buckets[keep], data[keep]
+        if not len(indexes):
+            return
+        add(self.buckets, self.counts, self.values, indexes, buckets, data)
+        add(self.fleet_buckets, self.fleet_counts, self.fleet_values, np.zeros(len(indexes), dtype=np.int64), buckets, data)
+        np.maximum.at(self.newest, indexes, buckets)
+
+    def sweep(self, now):
+        # forget sensors that have nothing left inside the horizon so their rows can be reused
+        oldest = int(now // self.bucket_seconds) - self.horizon_slots
+        for sensor_id in [sensor_id for sensor_id, index in self.sensors.items() if self.newest[index] <= oldest]:
+            index = self.sensors.pop(sensor_id)
+            self.sensor_ids[index] = None
+            self.buckets[index] = -1
+            self.newest[index] = -1
+            self.free_rows.append(index)
+        for sensor_id in [sensor_id for sensor_id, dropped_at in self.dropped.items() if dropped_at < now - self.horizon]:
+            del self.dropped[sensor_id]
+
+    def covers(self, window_seconds, sensor_id, max_lag):
+        now = time.time()
+        start = now - window_seconds
+        if window_seconds > self.horizon or self.started_at is None or start < self.started_at:
+            return False
+        if self.caught_up_at is None or now - self.caught_up_at > max_lag:
+            return False
+        if sensor_id is None:
+            return self.last_drop is None or self.last_drop < start
+        return self.dropped.get(sensor_id, 0) < start
+
+    def window(self, window_seconds):
+        now = time.time()
+        return int((now - window_seconds) // self.bucket_seconds), int(now // self.bucket_seconds)
+
+    def row(self, count, totals):
+        row = {"count": int(count)}
+        for col, metric in enumerate(self.metrics):
+            row[f"{metric}_sum"] = float(totals[sum_stat, col])
+            row[f"{metric}_min"] = float(totals[min_stat, col])
+            row[f"{metric}_max"] = float(totals[max_stat, col])
+            row[f"{metric}_sumsq"] = float(totals[sumsq_stat, col])
+        return row
+
+    def aggregate(self, window_seconds, sensor_id=None):
+        first, last = self.window(window_seconds)
+        if sensor_id is None:
+            counts, totals = reduce(self.fleet_buckets, self.fleet_counts, self.fleet_values, first, last)
+        elif sensor_id in self.sensors:
+            rows = slice(self.sensors[sensor_id], self.sensors[sensor_id] + 1)
+            counts, totals = reduce(self.buckets[rows], self.counts[rows], self.values[rows], first, last)
+        else:
+            return self.row(0, empty_totals(len(self.metrics)))
+        return self.row(counts[0], totals[0])
+
+    def aggregate_by_sensor(self, window_seconds):
+        first, last = self.window(window_seconds)
+        rows = len(self.sensor_ids)
+        counts, totals = reduce(self.buckets[:rows], self.counts[:rows], self.values[:rows], first, last)
+        return {self.sensor_ids[index]: self.row(counts[index], totals[index]) for index in np.flatnonzero(counts)}
+
+    def stats(self):
+        return {
+            "sensors": len(self.sensors),
+            "max_sensors": self.max_sensors,
+            "bytes": len(self.sensors) * self.sensor_bytes,
+            "max_bytes": self.max_bytes,
+            "horizon_seconds": self.horizon,
+            "bucket_seconds": self.bucket_seconds,
+            "dropped_sensors": len(self.dropped),
+            "started_at": self.started_at,
+            "caught_up_at": self.caught_up_at
+        }
@@ -0,0 +1,159 @@
+import asyncpg
+from datetime import timedelta
+
+metrics = ["temperature", "humidity", "vibration", "load"]
+
+# coarsest first, see sensor-data/rollups.py for how the tables are kept
+levels = [
+    ("hour", "sensor_rollup_hour", timedelta(hours=1)),
+    ("minute", "sensor_rollup_minute", timedelta(minutes=1))
+]
+
+def floor(ts, step):
+    if step == timedelta(hours=1):
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(second=0, microsecond=0)
+
+def ceil(ts, step):
+    start = floor(ts, step)
+    return start if start == ts else start + step
+
+async def coverage(conn):
+    # the earliest bucket from which each rollup level agrees with the raw rows
+    try:
+        state = await conn.fetchrow("SELECT covered_since, minute_since FROM rollup_state")
+    except asyncpg.UndefinedTableError:
+        return {}
+    if state is None:
+        return {}
+    return {
+        "hour": state["covered_since"],
+        "minute": max(state["covered_since"], state["minute_since"])
+    }
+
+def plan(start, end, covered, level=0):
+    # splits [start, end) into the coarsest buckets that fit, end None meaning open ended.
+    # rollups are written in the same transaction as the raw rows, so the still open buckets
+    # at the end of the window are exact and only the partial bucket at the start needs finer data.
+    if end is not None and start >= end:
+        return []
+    if level == len(levels):
+        return [("raw", "sensor_readings", start, end)]
+
+    unit, table, step = levels[level]
+    since = covered.get(unit)
+    if since is None or (end is not None and end <= since):
+        return plan(start, end, covered, level + 1)
+
+    pieces = []
+    if start < since:
+        pieces.extend(plan(start, since, covered, level + 1))
+        start = since
+    first = ceil(start, step)
+    last = None if end is None else floor(end, step)
+    if last is not None and first >= last:
+        return pieces + plan(start, end, covered, level + 1)
+
+    pieces.extend(plan(start, first, covered, level + 1))
+    pieces.append((unit, table, first, last))
+    if last is not None:
+        pieces.extend(plan(last, end, covered, level + 1))
+    return pieces
+
+def piece_query(source, table, column, args, start, end, sensor_filter, group_by_sensor):
+    args.append(start)
+    conditions = [f"{column} >= ${len(args)}"]
+    if end is not None:
+        args.append(end)
+        conditions.append(f"{column} < ${len(args)}")
+    if sensor_filter:
+        conditions.append(sensor_filter)
+
+    selects = ["sensor_id"] if group_by_sensor else []
+    if source == "raw":
+        selects.append("COUNT(*) AS count")
+        for metric in metrics:
+            selects.extend([
+                f"SUM({metric}) AS {metric}_sum",
+                f"MIN({metric}) AS {metric}_min",
+                f"MAX({metric}) AS {metric}_max",
+                f"SUM({metric} * {metric}) AS {metric}_sumsq"
+            ])
+    else:
+        selects.append("SUM(count) AS count")
+        for metric in metrics:
+            selects.extend([
+                f"SUM({metric}_sum) AS {metric}_sum",
+                f"MIN({metric}_min) AS {metric}_min",
+                f"MAX({metric}_max) AS {metric}_max",
+                f"SUM({metric}_sumsq) AS {metric}_sumsq"
+            ])
+
+    group = "GROUP BY sensor_id" if group_by_sensor else ""
+    return f"SELECT {', '.join(selects)} FROM {table} WHERE {' AND '.join(conditions)} {group}"
+
+def like_prefix(prefix):
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def aggregate_query(pieces, sensor_id=None, group_by_sensor=False, sensor_ids=None, prefix=None):
+    args = []
+    sensor_filter = None
+    if sensor_id is not None:
+        args.append(sensor_id)
+        sensor_filter = "sensor_id = $1"
+    elif sensor_ids is not None:
+        args.append(sensor_ids)
+        sensor_filter = "sensor_id = ANY($1)"
+    elif prefix is not None:
+        args.append(like_prefix(prefix))
+        sensor_filter = "sensor_id LIKE $1"
+
+    parts = []
+    for source, table, start, end in pieces:
+        column = "timestamp" if source == "raw" else "bucket"
+        parts.append(piece_query(source, table, column, args, start, end, sensor_filter, group_by_sensor))
+
+    selects = ["sensor_id"] if group_by_sensor else []
+    selects.append("SUM(count)::bigint AS count")
+    for metric in metrics:
+        selects.extend([
+            f"SUM({metric}_sum) AS {metric}_sum",
+            f"MIN({metric}_min) AS {metric}_min",
+            f"MAX({metric}_max) AS {metric}_max",
+            f"SUM({metric}_sumsq) AS {metric}_sumsq"
+        ])
+    group = "GROUP BY sensor_id ORDER BY sensor_id" if group_by_sensor else ""
+    query = f"""
+        SELECT {', '.join(selects)}
+        FROM ({' UNION ALL '.join(parts)}) pieces
+        {group}
+    """
+    return query, args
+
+async def window_query(conn, start, sensor_id=None, group_by_sensor=False, sensor_ids=None, prefix=None):
+    pieces = plan(start, None, await coverage(conn))
+    return aggregate_query(pieces, sensor_id, group_by_sensor, sensor_ids, prefix)
+
+def summarize(row):
+    count = row["count"] or 0
+    result = {"count": count}
+    for metric in metrics:
+        if not count:
+            result[metric] = None
+            continue
+        mean = row[f"{metric}_sum"] / count
+        variance = max(row[f"{metric}_sumsq"] / count - mean * mean, 0.0)
+        result[metric] = {
+            "avg": mean,
+            "min": row[f"{metric}_min"],
+            "max": row[f"{metric}_max"],
+            "stddev": variance ** 0.5
+        }
+    return result
+
+async def aggregate(conn, start, sensor_id=None, group_by_sensor=False):
+    query, args = await window_query(conn, start, sensor_id, group_by_sensor)
+    rows = await conn.fetch(query, *args)
+    if group_by_sensor:
+        return {row["sensor_id"]: summarize(row) for row in rows}
+    return summarize(rows[0])
@@ -0,0 +1,113 @@
+import numpy as np
+from datetime import datetime, timedelta
+
+import rollups
+
+epoch = datetime(1970, 1, 1)
+
+# rollup levels a bucketed series can be read from, coarsest first
+units = [
+    ("hour", "sensor_rollup_hour", 3600),
+    ("minute", "sensor_rollup_minute", 60)
+]
+
+def floor_to(ts, seconds):
+    return epoch + timedelta(seconds=(ts - epoch).total_seconds() // seconds * seconds)
+
+def bucket_source(start, width, covered):
+    # buckets of at least a minute come from the rollups when the whole range is covered,
+    # rounded up to whole rollup buckets, anything finer is binned from the raw rows
+    for unit, table, seconds in units:
+        since = covered.get(unit)
+        aligned = floor_to(start, seconds)
+        if since is not None and width >= seconds and aligned >= since:
+            return table, aligned, -(-width // seconds) * seconds
+    return None, start, width
+
+async def bucket_series(conn, sensor_id, metric, start, end, points):
+    width = max(1, -(-int((end - start).total_seconds()) // points))
+    table, start, width = bucket_source(start, width, await rollups.coverage(conn))
+    if table is None:
+        rows = await conn.fetch(f"""
+            SELECT date_bin($4 * interval '1 second', timestamp, $2) AS bucket,
+                MIN({metric}) AS min, MAX({metric}) AS max, AVG({metric}) AS avg, COUNT(*) AS count
+            FROM sensor_readings
+            WHERE sensor_id = $1 AND timestamp >= $2 AND timestamp < $3
+            GROUP BY 1
+            ORDER BY 1
+        """, sensor_id, start, end, width)
+    else:
+        rows = await conn.fetch(f"""
+            SELECT date_bin($4 * interval '1 second', bucket, $2) AS bucket,
+                MIN({metric}_min) AS min, MAX({metric}_max) AS max,
+                SUM({metric}_sum) / SUM(count) AS avg, SUM(count)::bigint AS count
+            FROM {table}
+            WHERE sensor_id = $1 AND bucket >= $2 AND bucket < $3
+            GROUP BY 1
+            ORDER BY 1
+        """, sensor_id, start, end, width)
+
+    values = np.array([(row["min"], row["max"], row["avg"]) for row in rows], dtype=np.float64).reshape(-1, 3).round(2)
+    return {
+        "mode": "bucket",
+        "from": start.isoformat(),
+        "bucket_seconds": width,
+        "timestamps": [row["bucket"].isoformat() for row in rows],
+        "min": values[:, 0].tolist(),
+        "max": values[:, 1].tolist(),
+        "avg": values[:, 2].tolist(),
+        "count": [row["count"] for row in rows]
+    }
+
+def lttb(x, y, threshold):
+    # largest triangle three buckets: keeps the first and last point and from every bucket in
+    # between the point forming the largest triangle with the one kept before it and the
+    # average of the next bucket
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    bounds = (np.floor(np.arange(threshold - 1) * every) + 1).astype(np.int64)
+    bounds[-1] = n - 1
+    sizes = np.diff(bounds)
+    avg_x = np.add.reduceat(x[1:n - 1], bounds[:-1] - 1) / sizes
+    avg_y = np.add.reduceat(y[1:n - 1], bounds[:-1] - 1) / sizes
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        if i + 1 < threshold - 2:
+            cx, cy = avg_x[i + 1], avg_y[i + 1]
+        else:
+            cx, cy = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - cx) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (cy - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+async def lttb_series(conn, sensor_id, metric, start, end, points, max_rows):
+    row = await conn.fetchrow(f"""
+        SELECT array_agg(extract(epoch FROM timestamp)::float8 ORDER BY timestamp) AS x,
+            array_agg({metric} ORDER BY timestamp) AS y
+        FROM (
+            SELECT timestamp, {metric} FROM sensor_readings
+            WHERE sensor_id = $1 AND timestamp >= $2 AND timestamp < $3
+            ORDER BY timestamp
+            LIMIT $4
+        ) readings
+    """, sensor_id, start, end, max_rows + 1)
+    x = np.array(row["x"] or [], dtype=np.float64)
+    y = np.array(row["y"] or [], dtype=np.float64)
+    if len(x) > max_rows:
+        return None
+
+    selected = lttb(x, y, points)
+    return {
+        "mode": "lttb",
+        "from": start.isoformat(),
+        "timestamps": [(epoch + timedelta(seconds=float(seconds))).isoformat() for seconds in x[selected]],
+        "value": y[selected].round(2).tolist()
+    }
@@ -0,0 +1,154 @@
+import math
+import struct
+
+# a DDSketch: values are counted in logarithmic bins whose width keeps every quantile within
+# relative_accuracy of the true value, and two sketches merge by adding their bin counts.
+# a sensor hour of a typical metric fills a few dozen to a few hundred bins.
+relative_accuracy = 0.01
+gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+log_gamma = math.log(gamma)
+min_value = 1e-9
+max_bins = 2048
+version = 1
+
+class DDSketch:
+    __slots__ = ("positive", "negative", "zero", "count", "min", "max")
+
+    def __init__(self):
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        if value > min_value:
+            index = math.ceil(math.log(value) / log_gamma)
+            self.positive[index] = self.positive.get(index, 0) + 1
+        elif value < -min_value:
+            index = math.ceil(math.log(-value) / log_gamma)
+            self.negative[index] = self.negative.get(index, 0) + 1
+        else:
+            self.zero += 1
+        self.count += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self.positive) > max_bins or len(self.negative) > max_bins:
+            self.collapse()
+
+    def merge(self, other):
+        for index, count in other.positive.items():
+            self.positive[index] = self.positive.get(index, 0) + count
+        for index, count in other.negative.items():
+            self.negative[index] = self.negative.get(index, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self.positive) > max_bins or len(self.negative) > max_bins:
+            self.collapse()
+        return self
+
+    def collapse(self):
+        # folds the bins closest to zero together, which only loses accuracy for the smallest values
+        for bins in (self.positive, self.negative):
+            if len(bins) <= max_bins:
+                continue
+            indexes = sorted(bins)
+            keep = indexes[len(indexes) - max_bins:]
+            folded = sum(bins.pop(index) for index in indexes[:len(indexes) - max_bins])
+            bins[keep[0]] += folded
+
+    def values(self):
+        # (representative value, count) in ascending order
+        for index in sorted(self.negative, reverse=True):
+            yield -2 * gamma ** index / (gamma + 1), self.negative[index]
+        if self.zero:
+            yield 0.0, self.zero
+        for index in sorted(self.positive):
+            yield 2 * gamma ** index / (gamma + 1), self.positive[index]
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in self.values():
+            seen += count
+            if seen > rank:
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def histogram(self, bins):
+        if not self.count:
+            return []
+        width = (self.max - self.min) / bins or 1.0
+        counts = [0] * bins
+        for value, count in self.values():
+            position = int((min(max(value, self.min), self.max) - self.min) / width)
+            counts[min(position, bins - 1)] += count
+        return [
+            {"from": self.min + i * width, "to": self.min + (i + 1) * width, "count": count}
+            for i, count in enumerate(counts)
+        ]
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def write_bins(out, bins):
+    # indexes are delta encoded and zigzagged since neighbouring bins are usually occupied
+    write_varint(out, len(bins))
+    previous = 0
+    for index in sorted(bins):
+        delta = index - previous
+        write_varint(out, delta * 2 if delta >= 0 else -delta * 2 - 1)
+        write_varint(out, bins[index])
+        previous = index
+
+def read_bins(data, pos):
+    size, pos = read_varint(data, pos)
+    bins = {}
+    index = 0
+    for i in range(size):
+        delta, pos = read_varint(data, pos)
+        index += delta // 2 if delta % 2 == 0 else -(delta + 1) // 2
+        bins[index], pos = read_varint(data, pos)
+    return bins, pos
+
+def encode(sketch):
+    out = bytearray([version])
+    out += struct.pack("<dd", sketch.min, sketch.max)
+    write_varint(out, sketch.zero)
+    write_bins(out, sketch.positive)
+    write_bins(out, sketch.negative)
+    return bytes(out)
+
+def decode(data):
+    sketch = DDSketch()
+    if not data:
+        return sketch
+    if data[0] != version:
+        raise ValueError(f"unsupported sketch version {data[0]}")
+    sketch.min, sketch.max = struct.unpack_from("<dd", data, 1)
+    sketch.zero, pos = read_varint(data, 17)
+    sketch.positive, pos = read_bins(data, pos)
+    sketch.negative, pos = read_bins(data, pos)
+    sketch.count = sketch.zero + sum(sketch.positive.values()) + sum(sketch.negative.values())
+    return sketch
@@ -0,0 +1,211 @@
+import asyncio
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+
+import codec
+import sketch
+
+sensor_stream = os.getenv("SENSOR_STREAM", "sensor_stream")
+sensor_stream_shards = int(os.getenv("SENSOR_STREAM_SHARDS", "16"))
+sketch_metrics = [metric for metric in os.getenv("ANALYTICS_SKETCH_METRICS", "vibration,load").split(",") if metric]
+flush_seconds = float(os.getenv("ANALYTICS_SKETCH_FLUSH_SECONDS", "5"))
+retention_days = int(os.getenv("ANALYTICS_SKETCH_RETENTION_DAYS", "90"))
+consumer_group = "analytics_sketches"
+read_count = 1000
+read_block_ms = 1000
+flush_entries = 20000
+claim_idle_ms = 60000
+claim_interval = 30
+expire_interval = 3600
+
+# sensor_sketches holds one sketch per (hour, sensor, metric) and fleet_sketches one per
+# (hour, metric), so a fleet-wide window merges one sketch per hour instead of one per sensor.
+# entries are acknowledged only after their sketches are committed, a builder that dies in
+# between has them claimed and counted again, which a sketch shrugs off.
+
+async def create_tables(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS sensor_sketches (
+            bucket TIMESTAMP NOT NULL,
+            sensor_id VARCHAR(100) NOT NULL,
+            metric VARCHAR(20) NOT NULL,
+            count BIGINT NOT NULL,
+            sketch BYTEA NOT NULL,
+            PRIMARY KEY (bucket, sensor_id, metric)
+        )
+    """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sensor_sketches_sensor ON sensor_sketches(sensor_id, metric, bucket)
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS fleet_sketches (
+            bucket TIMESTAMP NOT NULL,
+            metric VARCHAR(20) NOT NULL,
+            count BIGINT NOT NULL,
+            sketch BYTEA NOT NULL,
+            PRIMARY KEY (bucket, metric)
+        )
+    """)
+
+def streams():
+    return [f"{sensor_stream}:{shard}" for shard in range(sensor_stream_shards)]
+
+async def create_groups(client):
+    for stream in streams():
+        try:
+            await client.xgroup_create(stream, consumer_group, id="$", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+def accumulate(pending, entries):
+    for entry_id, fields in entries:
+        try:
+            data = codec.decode_entry(fields)
+            bucket = datetime.fromtimestamp(codec.entry_timestamp(data)).replace(minute=0, second=0, microsecond=0)
+            values = [float(data[metric]) for metric in sketch_metrics]
+        except (KeyError, ValueError, TypeError) as e:
+            print(f"skipping malformed message {entry_id}: {e}")
+            continue
+        for metric, value in zip(sketch_metrics, values):
+            key = (bucket, data["sensor_id"], metric)
+            current = pending.get(key)
+            if current is None:
+                current = pending[key] = sketch.DDSketch()
+            current.add(value)
+
+async def merge_rows(conn, table, key_columns, key_types, rows):
+    # placeholders first so that every key exists, then the rows are locked in key order and
+    # merged, which keeps concurrent builders from overwriting or deadlocking on each other
+    keys = sorted(rows)
+    columns = [list(column) for column in zip(*keys)]
+    names = ", ".join(key_columns)
+    unnest = ", ".join(f"${i + 1}::{kind}[]" for i, kind in enumerate(key_types))
+    order = ", ".join(f'{column} COLLATE "C"' if kind == "varchar" else column for column, kind in zip(key_columns, key_types))
+    await conn.execute(f"""
+        INSERT INTO {table} ({names}, count, sketch)
+        SELECT *, 0, ${len(key_types) + 1}::bytea FROM unnest({unnest})
+        ON CONFLICT DO NOTHING
+    """, *columns, sketch.encode(sketch.DDSketch()))
+    stored = await conn.fetch(f"""
+        SELECT {names}, sketch FROM {table}
+        WHERE ({names}) IN (SELECT * FROM unnest({unnest}))
+        ORDER BY {order}
+        FOR UPDATE
+    """, *columns)
+
+    keys, counts, encoded = await asyncio.to_thread(merge_stored, stored, key_columns, rows)
+    matches = " AND ".join(f"t.{column} = u.{column}" for column in key_columns)
+    await conn.execute(f"""
+        UPDATE {table} AS t SET count = u.count, sketch = u.sketch
+        FROM unnest({unnest}, ${len(key_types) + 1}::bigint[], ${len(key_types) + 2}::bytea[]) AS u({names}, count, sketch)
+        WHERE {matches}
+    """, *[list(column) for column in zip(*keys)], counts, encoded)
+
+def merge_stored(stored, key_columns, rows):
+    # decoding, merging and encoding again takes tens of microseconds per sketch, so this and
+    # fleet_sketches run in a worker thread rather than on the event loop
+    keys, counts, encoded = [], [], []
+    for row in stored:
+        key = tuple(row[column] for column in key_columns)
+        merged = sketch.decode(row["sketch"]).merge(rows[key])
+        keys.append(key)
+        counts.append(merged.count)
+        encoded.append(sketch.encode(merged))
+    return keys, counts, encoded
+
+def fleet_sketches(pending):
+    fleet = {}
+    for (bucket, sensor_id, metric), value in pending.items():
+        fleet.setdefault((bucket, metric), sketch.DDSketch()).merge(value)
+    return fleet
+
+async def flush(pool, pending):
+    fleet = await asyncio.to_thread(fleet_sketches, pending)
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await merge_rows(conn, "sensor_sketches", ["bucket", "sensor_id", "metric"], ["timestamp", "varchar", "varchar"], pending)
+            await merge_rows(conn, "fleet_sketches", ["bucket", "metric"], ["timestamp", "varchar"], fleet)
+
+async def expire(pool):
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM sensor_sketches WHERE bucket < $1", cutoff)
+        await conn.execute("DELETE FROM fleet_sketches WHERE bucket < $1", cutoff)
+
+async def claim(client, consumer_name):
+    # picks up what a builder that went away had read but not yet committed
+    claimed = {}
+    for stream in streams():
+        response = await client.xautoclaim(stream, consumer_group, consumer_name, claim_idle_ms, "0-0", count=read_count)
+        if response[1]:
+            claimed[stream] = response[1]
+    return claimed
+
+async def build(pool, client):
+    consumer_name = f"{socket.gethostname()}-{os.getpid()}"
+    await create_groups(client)
+    pending = {}
+    unacked = {}
+    entries_read = 0
+    last_flush = time.monotonic()
+    last_claim = 0
+    last_expire = 0
+    while True:
+        try:
+            if time.monotonic() - last_claim >= claim_interval:
+                response = list((await claim(client, consumer_name)).items())
+                last_claim = time.monotonic()
+            else:
+                response = await client.xreadgroup(
+                    consumer_group, consumer_name, {stream: ">" for stream in streams()},
+                    count=read_count, block=read_block_ms
+                )
+            for stream, entries in response or []:
+                stream = stream.decode() if isinstance(stream, bytes) else stream
+                accumulate(pending, entries)
+                unacked.setdefault(stream, []).extend(entry_id for entry_id, fields in entries)
+                entries_read += len(entries)
+
+            if unacked and (entries_read >= flush_entries or time.monotonic() - last_flush >= flush_seconds):
+                if pending:
+                    await flush(pool, pending)
+                for stream, entry_ids in unacked.items():
+                    await client.xack(stream, consumer_group, *entry_ids)
+                pending = {}
+                unacked = {}
+                entries_read = 0
+                last_flush = time.monotonic()
+            elif not unacked:
+                last_flush = time.monotonic()
+
+            if time.monotonic() - last_expire >= expire_interval:
+                await expire(pool)
+                last_expire = time.monotonic()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # whatever was read stays pending in the group and is claimed again later
+            print(f"error building sketches: {e}")
+            pending = {}
+            unacked = {}
+            entries_read = 0
+            await asyncio.sleep(1)
+
+async def window_sketch(conn, metric, start, sensor_ids=None):
+    if sensor_ids:
+        rows = await conn.fetch("""
+            SELECT sketch FROM sensor_sketches
+            WHERE sensor_id = ANY($1) AND metric = $2 AND bucket >= $3
+        """, sensor_ids, metric, start)
+    else:
+        rows = await conn.fetch("""
+            SELECT sketch FROM fleet_sketches
+            WHERE metric = $1 AND bucket >= $2
+        """, metric, start)
+    merged = sketch.DDSketch()
+    for row in rows:
+        merged.merge(sketch.decode(row["sketch"]))
+    return merged
@@ -0,0 +1,53 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# logs the service compresses get the encoding's suffix, so app.log compressed with gzip is
+# stored and listed as app.log.gz. the encoding is also recorded in the index and downloads go by
+# that alone, an uploaded app.tar.gz has the same suffix but is served as it was uploaded.
+suffixes = {"gzip": ".gz", "zstd": ".zst"}
+
+def available():
+    return ["none", "gzip"] + (["zstd"] if zstandard is not None else [])
+
+def encoding_for(filename):
+    for encoding, suffix in suffixes.items():
+        if filename.endswith(suffix):
+            return encoding
+    return None
+
+def strip_suffix(filename, encoding):
+    suffix = suffixes.get(encoding, "")
+    return filename[:-len(suffix)] if suffix and filename.endswith(suffix) else filename
+
+def compressor(encoding):
+    if encoding == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor().compressobj()
+    return None
+
+class GzipDecompressor:
+    # concatenated gzip members are valid gzip, so a new member starts where one ends
+    def __init__(self):
+        self.inner = zlib.decompressobj(31)
+
+    def decompress(self, data):
+        out = []
+        while data:
+            out.append(self.inner.decompress(data))
+            if not self.inner.eof:
+                break
+            data = self.inner.unused_data
+            self.inner = zlib.decompressobj(31)
+        return b"".join(out)
+
+def decompressor(encoding):
+    if encoding == "gzip":
+        return GzipDecompressor()
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    return None
@@ -0,0 +1,186 @@
+import os
+import sqlite3
+
+file_types = {"logs": "log", "graphs": "graph"}
+
+# one row per stored file, plus per type totals kept up to date by triggers so stats never walk
+# the directories. encoding is set only for files the service compressed itself, files found on
+# disk are never assumed to be. every call opens its own connection, they are cheap and this
+# keeps the module safe to call from worker threads.
+
+schema = """
+CREATE TABLE IF NOT EXISTS files (
+    file_type TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    modified REAL NOT NULL,
+    encoding TEXT,
+    PRIMARY KEY (file_type, filename)
+);
+CREATE INDEX IF NOT EXISTS idx_files_modified ON files(modified, file_type, filename);
+CREATE INDEX IF NOT EXISTS idx_files_filename ON files(filename);
+CREATE TABLE IF NOT EXISTS totals (
+    file_type TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals VALUES ('logs', 0, 0), ('graphs', 0, 0);
+CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files BEGIN
+    UPDATE totals SET count = count + 1, size = size + NEW.size WHERE file_type = NEW.file_type;
+END;
+CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files BEGIN
+    UPDATE totals SET count = count - 1, size = size - OLD.size WHERE file_type = OLD.file_type;
+END;
+CREATE TRIGGER IF NOT EXISTS files_update AFTER UPDATE OF size ON files BEGIN
+    UPDATE totals SET size = size - OLD.size + NEW.size WHERE file_type = NEW.file_type;
+END;
+"""
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def setup(path):
+    conn = connect(path)
+    try:
+        conn.executescript(schema)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(files)")]
+        if "encoding" not in columns:
+            conn.execute("ALTER TABLE files ADD COLUMN encoding TEXT")
+    finally:
+        conn.close()
+
+def scan(files_dir, file_type):
+    found = {}
+    with os.scandir(os.path.join(files_dir, file_type)) as entries:
+        for entry in entries:
+            if entry.is_file():
+                stat = entry.stat()
+                found[entry.name] = (stat.st_size, stat.st_mtime)
+    return found
+
+def reconcile(path, files_dir):
+    # brings the index in line with what is actually on disk, e.g. after files were copied in or
+    # removed by hand, and returns how many rows changed
+    changed = 0
+    conn = connect(path)
+    try:
+        with conn:
+            for file_type in file_types:
+                on_disk = scan(files_dir, file_type)
+                indexed = {
+                    filename: (size, modified)
+                    for filename, size, modified in conn.execute(
+                        "SELECT filename, size, modified FROM files WHERE file_type = ?", (file_type,)
+                    )
+                }
+                gone = [(file_type, filename) for filename in indexed if filename not in on_disk]
+                stale = [
+                    (file_type, filename, size, modified)
+                    for filename, (size, modified) in on_disk.items()
+                    if indexed.get(filename) != (size, modified)
+                ]
+                conn.executemany("DELETE FROM files WHERE file_type = ? AND filename = ?", gone)
+                conn.executemany("""
+                    INSERT INTO files (file_type, filename, size, modified) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (file_type, filename) DO UPDATE SET size = excluded.size, modified = excluded.modified
+                """, stale)
+                changed += len(gone) + len(stale)
+    finally:
+        conn.close()
+    return changed
+
+def add(path, file_type, filename, size, modified, encoding=None):
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute("""
+                INSERT INTO files (file_type, filename, size, modified, encoding) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (file_type, filename) DO UPDATE
+                SET size = excluded.size, modified = excluded.modified, encoding = excluded.encoding
+            """, (file_type, filename, size, modified, encoding))
+    finally:
+        conn.close()
+
+def encoding(path, file_type, filename):
+    conn = connect(path)
+    try:
+        row = conn.execute(
+            "SELECT encoding FROM files WHERE file_type = ? AND filename = ?", (file_type, filename)
+        ).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+def remove(path, file_type, filename):
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM files WHERE file_type = ? AND filename = ?", (file_type, filename))
+    finally:
+        conn.close()
+
+def prefix_end(prefix):
+    # the smallest string above every string starting with prefix, None if there is none. text
+    # compares bytewise as utf-8, which orders like code points, so bumping the last one is enough
+    while prefix and prefix[-1] == chr(0x10FFFF):
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    code = ord(prefix[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000
+    return prefix[:-1] + chr(code)
+
+def list_files(path, file_type=None, prefix=None, start=None, end=None, min_size=None, max_size=None, cursor=None, limit=100):
+    # newest first, paged by the (modified, file_type, filename) of the last row returned
+    conditions = []
+    args = []
+    if file_type is not None:
+        conditions.append("file_type = ?")
+        args.append(file_type)
+    if prefix:
+        # a range rather than substr so the primary key, or idx_files_filename without a type, applies
+        conditions.append("filename >= ?")
+        args.append(prefix)
+        upper = prefix_end(prefix)
+        if upper is not None:
+            conditions.append("filename < ?")
+            args.append(upper)
+    if start is not None:
+        conditions.append("modified >= ?")
+        args.append(start)
+    if end is not None:
+        conditions.append("modified < ?")
+        args.append(end)
+    if min_size is not None:
+        conditions.append("size >= ?")
+        args.append(min_size)
+    if max_size is not None:
+        conditions.append("size <= ?")
+        args.append(max_size)
+    if cursor is not None:
+        conditions.append("(modified, file_type, filename) < (?, ?, ?)")
+        args.extend(cursor)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    args.append(limit)
+
+    conn = connect(path)
+    try:
+        return conn.execute(f"""
+            SELECT file_type, filename, size, modified FROM files
+            {where}
+            ORDER BY modified DESC, file_type DESC, filename DESC
+            LIMIT ?
+        """, args).fetchall()
+    finally:
+        conn.close()
+
+def totals(path):
+    conn = connect(path)
+    try:
+        return {file_type: (count, size) for file_type, count, size in conn.execute("SELECT file_type, count, size FROM totals")}
+    finally:
+        conn.close()
@@ -1,7 +1,13 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.responses import FileResponse, StreamingResponse
 import os
 import aiofiles
+import asyncio
+import base64
+import compression
+import index
+import uploads
+import uuid
 from datetime import datetime
 from pathlib import Path
 import json
@@ -9,85 +15,217 @@ import json
 app = FastAPI()
 
 files_dir = os.getenv("FILES_DIR", "/app/storage")
+max_upload_bytes = int(os.getenv("FILES_MAX_UPLOAD_MB", "4096")) * 1024 * 1024
+log_compression = os.getenv("FILES_LOG_COMPRESSION", "none")
+chunk_size = 1024 * 1024
+# room for the multipart boundaries and headers around the file itself
+multipart_overhead = 64 * 1024
+index_path = os.path.join(files_dir, "index.db")
+list_max_limit = 10000
+
 Path(files_dir).mkdir(parents=True, exist_ok=True)
 Path(os.path.join(files_dir, "logs")).mkdir(parents=True, exist_ok=True)
 Path(os.path.join(files_dir, "graphs")).mkdir(parents=True, exist_ok=True)
+# uploads are written here first and renamed into place, on the same filesystem
+Path(os.path.join(files_dir, "tmp")).mkdir(parents=True, exist_ok=True)
+
+@app.on_event("startup")
+async def startup():
+    tmp_path = os.path.join(files_dir, "tmp")
+    for filename in os.listdir(tmp_path):
+        os.remove(os.path.join(tmp_path, filename))
+    
+    await asyncio.to_thread(index.setup, index_path)
+    changed = await asyncio.to_thread(index.reconcile, index_path, files_dir)
+    if changed:
+        print(f"files index reconciled {changed} entries with disk")
+
+upload_body = {
+    "requestBody": {
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        },
+        "required": True
+    }
+}
+
+def open_upload(request):
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > max_upload_bytes + multipart_overhead:
+        raise HTTPException(status_code=413, detail="file too large")
+    return uploads.MultipartReader(request, max_upload_bytes + multipart_overhead)
+
+async def save_upload(file, filepath, encoding):
+    tmp_path = os.path.join(files_dir, "tmp", f"{uuid.uuid4().hex}.part")
+    compressor = compression.compressor(encoding)
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_upload_bytes:
+                    raise HTTPException(status_code=413, detail="file too large")
+                if compressor:
+                    # zlib and zstd release the GIL, so this does not stall other requests
+                    chunk = await asyncio.to_thread(compressor.compress, chunk)
+                if chunk:
+                    await f.write(chunk)
+            if compressor:
+                await f.write(compressor.flush())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size
+
+def accepts_encoding(request, encoding):
+    accepted = request.headers.get("accept-encoding", "")
+    return encoding in [part.split(";")[0].strip() for part in accepted.split(",")]
+
+def stream_file(filepath, encoding):
+    decompressor = compression.decompressor(encoding)
+    
+    async def generate():
+        async with aiofiles.open(filepath, 'rb') as f:
+            while True:
+                chunk = await f.read(chunk_size)
+                if not chunk:
+                    break
+                if decompressor:
+                    chunk = await asyncio.to_thread(decompressor.decompress, chunk)
+                if chunk:
+                    yield chunk
+    
+    return generate()
+
+def encode_cursor(row):
+    file_type, filename, size, modified = row
+    return base64.urlsafe_b64encode(f"{modified!r}|{file_type}|{filename}".encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        modified, file_type, filename = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 2)
+        return float(modified), file_type, filename
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
 
 @app.get("/files/list")
-async def list_files(file_type: str = None):
+async def list_files(
+    file_type: str = None,
+    prefix: str = None,
+    from_time: datetime = Query(None, alias="from"),
+    to_time: datetime = Query(None, alias="to"),
+    min_size: int = None,
+    max_size: int = None,
+    cursor: str = None,
+    limit: int = 1000
+):
     try:
+        if file_type not in [None, "logs", "graphs"]:
+            raise HTTPException(status_code=400, detail="invalid file type")
+        if not 1 <= limit <= list_max_limit:
+            raise HTTPException(status_code=400, detail=f"limit must be between 1 and {list_max_limit}")
+        
+        rows = await asyncio.to_thread(
+            index.list_files, index_path, file_type, prefix,
+            from_time.timestamp() if from_time else None,
+            to_time.timestamp() if to_time else None,
+            min_size, max_size,
+            decode_cursor(cursor) if cursor else None,
+            limit
+        )
+        
         result = []
+        for stored_type, filename, size, modified in rows:
+            result.append({
+                "type": index.file_types[stored_type],
+                "filename": filename,
+                "size": size,
+                "modified": datetime.fromtimestamp(modified).isoformat()
+            })
         
-        if file_type == "logs" or file_type is None:
-            logs_path = os.path.join(files_dir, "logs")
-            if os.path.exists(logs_path):
-                for filename in os.listdir(logs_path):
-                    filepath = os.path.join(logs_path, filename)
-                    if os.path.isfile(filepath):
-                        stat = os.stat(filepath)
-                        result.append({
-                            "type": "log",
-                            "filename": filename,
-                            "size": stat.st_size,
-                            "modified": datetime.fromtimestamp(stat.st_mtime).isoformat()
-                        })
-        
-        if file_type == "graphs" or file_type is None:
-            graphs_path = os.path.join(files_dir, "graphs")
-            if os.path.exists(graphs_path):
-                for filename in os.listdir(graphs_path):
-                    filepath = os.path.join(graphs_path, filename)
-                    if os.path.isfile(filepath):
-                        stat = os.stat(filepath)
-                        result.append({
-                            "type": "graph",
-                            "filename": filename,
-                            "size": stat.st_size,
-                            "modified": datetime.fromtimestamp(stat.st_mtime).isoformat()
-                        })
-        
-        return {"files": result}
+        next_cursor = encode_cursor(rows[-1]) if len(rows) == limit else None
+        return {"files": result, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/files/upload/log")
-async def upload_log(file: UploadFile = File(...)):
+async def index_file(file_type, filename, filepath, encoding=None):
+    stat = os.stat(filepath)
+    await asyncio.to_thread(index.add, index_path, file_type, filename, stat.st_size, stat.st_mtime, encoding)
+
+@app.post("/files/upload/log", openapi_extra=upload_body)
+async def upload_log(request: Request, compress: str = None):
     try:
-        if not file.filename:
+        encoding = compress or log_compression
+        if encoding not in compression.available():
+            raise HTTPException(status_code=400, detail=f"compress must be one of {', '.join(compression.available())}")
+        
+        file = open_upload(request)
+        filename = await file.file_part("file")
+        if not filename:
             raise HTTPException(status_code=400, detail="no filename")
+        # files that already carry a compression suffix are stored as they are
+        if encoding == "none" or compression.encoding_for(filename):
+            encoding = None
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{file.filename}"
+        safe_filename = f"{timestamp}_{filename}{compression.suffixes.get(encoding, '')}"
         filepath = os.path.join(files_dir, "logs", safe_filename)
         
-        async with aiofiles.open(filepath, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        size = await save_upload(file, filepath, encoding)
+        await index_file("logs", safe_filename, filepath, encoding)
         
-        return {"status": "ok", "filename": safe_filename, "path": f"logs/{safe_filename}"}
+        return {
+            "status": "ok",
+            "filename": safe_filename,
+            "path": f"logs/{safe_filename}",
+            "size": size,
+            "stored_size": os.path.getsize(filepath)
+        }
+    except HTTPException:
+        raise
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/files/upload/graph")
-async def upload_graph(file: UploadFile = File(...)):
+@app.post("/files/upload/graph", openapi_extra=upload_body)
+async def upload_graph(request: Request):
     try:
-        if not file.filename:
+        file = open_upload(request)
+        filename = await file.file_part("file")
+        if not filename:
             raise HTTPException(status_code=400, detail="no filename")
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{file.filename}"
+        safe_filename = f"{timestamp}_{filename}"
         filepath = os.path.join(files_dir, "graphs", safe_filename)
         
-        async with aiofiles.open(filepath, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
+        size = await save_upload(file, filepath, None)
+        await index_file("graphs", safe_filename, filepath)
         
-        return {"status": "ok", "filename": safe_filename, "path": f"graphs/{safe_filename}"}
+        return {"status": "ok", "filename": safe_filename, "path": f"graphs/{safe_filename}", "size": size}
+    except HTTPException:
+        raise
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/files/download/{file_type}/{filename}")
-async def download_file(file_type: str, filename: str):
+async def download_file(file_type: str, filename: str, request: Request):
     try:
         if file_type not in ["logs", "graphs"]:
             raise HTTPException(status_code=400, detail="invalid file type")
@@ -100,6 +238,27 @@ async def download_file(file_type: str, filename: str):
         if not os.path.isfile(filepath):
             raise HTTPException(status_code=400, detail="not a file")
         
+        # logs the service compressed are sent as they are to clients that accept the encoding and
+        # decompressed on the fly for everyone else, either way the client ends up with the original.
+        # anything else, graphs included, is sent exactly as it was uploaded
+        encoding = None
+        if file_type == "logs":
+            encoding = await asyncio.to_thread(index.encoding, index_path, "logs", filename)
+        original = compression.strip_suffix(filename, encoding)
+        if encoding and accepts_encoding(request, encoding):
+            return FileResponse(
+                filepath,
+                media_type="application/octet-stream",
+                filename=original,
+                headers={"Content-Encoding": encoding}
+            )
+        if encoding in compression.available():
+            return StreamingResponse(
+                stream_file(filepath, encoding),
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": f'attachment; filename="{original}"'}
+            )
+        
         return FileResponse(
             filepath,
             media_type="application/octet-stream",
@@ -111,19 +270,20 @@ async def download_file(file_type: str, filename: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/files/log/{filename}")
-async def get_log(filename: str):
+async def get_log(filename: str, request: Request):
     try:
         filepath = os.path.join(files_dir, "logs", filename)
         
         if not os.path.exists(filepath):
             raise HTTPException(status_code=404, detail="file not found")
         
-        async def generate():
-            async with aiofiles.open(filepath, 'r') as f:
-                async for line in f:
-                    yield line
+        encoding = await asyncio.to_thread(index.encoding, index_path, "logs", filename)
+        if encoding and accepts_encoding(request, encoding):
+            return FileResponse(filepath, media_type="text/plain", headers={"Content-Encoding": encoding})
+        if encoding and encoding not in compression.available():
+            raise HTTPException(status_code=415, detail=f"{encoding} is not available to decompress this log")
         
-        return StreamingResponse(generate(), media_type="text/plain")
+        return StreamingResponse(stream_file(filepath, encoding), media_type="text/plain")
     except HTTPException:
         raise
     except Exception as e:
@@ -141,6 +301,7 @@ async def delete_file(file_type: str, filename: str):
             raise HTTPException(status_code=404, detail="file not found")
         
         os.remove(filepath)
+        await asyncio.to_thread(index.remove, index_path, file_type, filename)
         
         return {"status": "ok", "message": "file deleted"}
     except HTTPException:
@@ -151,26 +312,9 @@ async def delete_file(file_type: str, filename: str):
 @app.get("/files/stats")
 async def get_stats():
     try:
-        logs_path = os.path.join(files_dir, "logs")
-        graphs_path = os.path.join(files_dir, "graphs")
-        
-        logs_count = 0
-        logs_size = 0
-        if os.path.exists(logs_path):
-            for filename in os.listdir(logs_path):
-                filepath = os.path.join(logs_path, filename)
-                if os.path.isfile(filepath):
-                    logs_count += 1
-                    logs_size += os.path.getsize(filepath)
-        
-        graphs_count = 0
-        graphs_size = 0
-        if os.path.exists(graphs_path):
-            for filename in os.listdir(graphs_path):
-                filepath = os.path.join(graphs_path, filename)
-                if os.path.isfile(filepath):
-                    graphs_count += 1
-                    graphs_size += os.path.getsize(filepath)
+        totals = await asyncio.to_thread(index.totals, index_path)
+        logs_count, logs_size = totals.get("logs", (0, 0))
+        graphs_count, graphs_size = totals.get("graphs", (0, 0))
         
         return {
             "logs": {
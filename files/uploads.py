@@ -0,0 +1,107 @@
+from collections import deque
+from multipart.multipart import MultipartParser, parse_options_header
+
+# reads a multipart/form-data body straight off the request stream, so an uploaded file goes
+# to disk once and a body without a content-length is capped by what is actually received.
+# the parser calls back synchronously for every chunk fed to it, the callbacks only queue
+# events which read drains.
+
+class UploadError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class MultipartReader:
+    def __init__(self, request, max_body_bytes):
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            raise UploadError(400, "expected a multipart/form-data body")
+
+        self.stream = request.stream()
+        self.max_body_bytes = max_body_bytes
+        self.received = 0
+        self.events = deque()
+        self.in_part = False
+        self.finished = False
+        self.header_field = b""
+        self.header_value = b""
+        self.headers = {}
+        self.parser = MultipartParser(options[b"boundary"], {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end
+        })
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data, start, end):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        self.events.append(("part", self.headers))
+
+    def on_part_data(self, data, start, end):
+        self.events.append(("data", data[start:end]))
+
+    def on_part_end(self):
+        self.events.append(("end", None))
+
+    async def next_event(self):
+        while not self.events:
+            if self.finished:
+                return None
+            try:
+                chunk = await self.stream.__anext__()
+            except StopAsyncIteration:
+                self.finished = True
+                continue
+            self.received += len(chunk)
+            if self.received > self.max_body_bytes:
+                raise UploadError(413, "file too large")
+            try:
+                self.parser.write(chunk)
+            except Exception:
+                raise UploadError(400, "malformed multipart body")
+        return self.events.popleft()
+
+    async def file_part(self, field):
+        # skips ahead to the part of the given field and returns its filename
+        while True:
+            event = await self.next_event()
+            if event is None:
+                raise UploadError(400, f"no {field} in the upload")
+            kind, headers = event
+            if kind != "part":
+                continue
+            disposition, options = parse_options_header(headers.get(b"content-disposition", b""))
+            if options.get(b"name") == field.encode() and b"filename" in options:
+                self.in_part = True
+                return options[b"filename"].decode("utf-8", "replace")
+
+    async def read(self, size):
+        # the next size or more bytes of the current part, b"" once it ended
+        data = bytearray()
+        while self.in_part and len(data) < size:
+            event = await self.next_event()
+            if event is None:
+                raise UploadError(400, "upload ended before the file did")
+            kind, payload = event
+            if kind == "end":
+                self.in_part = False
+            elif kind == "data":
+                data += payload
+        return bytes(data)
@@ -0,0 +1,56 @@
+import json
+import msgpack
+import timeit
+from datetime import datetime
+
+import codec
+from main import SensorData, build_message
+
+rounds = 100000
+
+reading = {
+    "sensor_id": "sensor_001",
+    "temperature": 55.25,
+    "humidity": 65.5,
+    "vibration": 85.125,
+    "load": 80.0,
+    "timestamp": "2024-01-01T12:00:00.123000"
+}
+
+json_body = json.dumps(reading).encode()
+msgpack_body = msgpack.packb(["sensor_001", 1704110400123, 55.25, 65.5, 85.125, 80.0])
+data = SensorData.model_validate_json(json_body)
+json_message = json.dumps(build_message(data))
+msgpack_message = codec.pack_message(data)
+
+def json_decode_message():
+    message = json.loads(json_message)
+    message["timestamp"] = datetime.fromisoformat(message["timestamp"])
+    return message
+
+def msgpack_decode_message():
+    sensor_id, timestamp, temperature, humidity, vibration, load = msgpack.unpackb(msgpack_message)
+    return datetime.fromtimestamp(timestamp / 1000)
+
+cases = [
+    ("ingest decode", lambda: SensorData.model_validate_json(json_body),
+        lambda: codec.validate_packed(SensorData, msgpack.unpackb(msgpack_body))),
+    ("queue encode", lambda: json.dumps(build_message(data)), lambda: codec.pack_message(data)),
+    ("queue decode", json_decode_message, msgpack_decode_message)
+]
+
+def run(func):
+    return min(timeit.repeat(func, number=rounds, repeat=5)) / rounds * 1e9
+
+if __name__ == "__main__":
+    print(f"{'step':<16}{'json ns':>12}{'msgpack ns':>12}")
+    json_total = 0
+    msgpack_total = 0
+    for name, json_func, msgpack_func in cases:
+        json_ns = run(json_func)
+        msgpack_ns = run(msgpack_func)
+        json_total += json_ns
+        msgpack_total += msgpack_ns
+        print(f"{name:<16}{json_ns:>12.0f}{msgpack_ns:>12.0f}")
+    print(f"{'total':<16}{json_total:>12.0f}{msgpack_total:>12.0f}")
+    print(f"payload bytes   {len(json_message):>12}{len(msgpack_message):>12}")
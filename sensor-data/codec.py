@@ -0,0 +1,50 @@
+import msgpack
+from datetime import datetime
+
+msgpack_types = ["application/msgpack", "application/x-msgpack", "application/vnd.msgpack"]
+
+reading_fields = ["sensor_id", "timestamp", "temperature", "humidity", "vibration", "load"]
+
+def is_msgpack(content_type):
+    return (content_type or "").split(";")[0].strip().lower() in msgpack_types
+
+def to_millis(ts):
+    return int(ts.timestamp() * 1000)
+
+def from_millis(ms):
+    return datetime.fromtimestamp(ms / 1000)
+
+def reading_from_packed(item):
+    # readings arrive either as a map with the json field names or as the compact
+    # [sensor_id, timestamp_ms, temperature, humidity, vibration, load] array
+    if isinstance(item, (list, tuple)):
+        if len(item) != len(reading_fields):
+            return item
+        item = dict(zip(reading_fields, item))
+        if item["timestamp"] is None:
+            del item["timestamp"]
+    if isinstance(item, dict) and type(item.get("timestamp")) is int:
+        try:
+            item["timestamp"] = from_millis(item["timestamp"])
+        except (ValueError, OverflowError, OSError):
+            pass
+    return item
+
+def validate_packed(model, item):
+    return model.model_validate(reading_from_packed(item))
+
+def unpack(body):
+    return msgpack.unpackb(body)
+
+def unpacker(max_buffer_size):
+    return msgpack.Unpacker(max_buffer_size=max_buffer_size)
+
+def pack_message(data):
+    return msgpack.packb([
+        data.sensor_id,
+        to_millis(data.timestamp),
+        data.temperature,
+        data.humidity,
+        data.vibration,
+        data.load
+    ])
@@ -0,0 +1,197 @@
+import asyncpg
+import os
+import re
+from datetime import datetime, timedelta
+
+partition_interval = os.getenv("PARTITION_INTERVAL", "day")
+partition_premake = int(os.getenv("PARTITION_PREMAKE", "3"))
+retention_hours = int(os.getenv("READINGS_RETENTION_HOURS", "0"))
+retention_mode = os.getenv("RETENTION_MODE", "drop")
+
+# any constant works, it only has to be shared by every sensor-data replica
+lock_key = 7301
+
+interval_steps = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1)
+}
+
+bound_pattern = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+if partition_interval not in interval_steps:
+    raise ValueError(f"PARTITION_INTERVAL must be one of {sorted(interval_steps)}")
+if retention_mode not in ["drop", "detach"]:
+    raise ValueError("RETENTION_MODE must be drop or detach")
+
+def period_start(ts):
+    if partition_interval == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def partition_name(start):
+    if partition_interval == "hour":
+        return f"sensor_readings_{start.strftime('%Y%m%d%H')}"
+    return f"sensor_readings_{start.strftime('%Y%m%d')}"
+
+def parse_bound(value):
+    if value in ["MINVALUE", "MAXVALUE"]:
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+async def list_partitions(conn):
+    rows = await conn.fetch("""
+        SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'sensor_readings'::regclass
+    """)
+
+    result = []
+    for row in rows:
+        match = bound_pattern.search(row["bound"])
+        if match:
+            result.append((row["name"], parse_bound(match.group(1)), parse_bound(match.group(2))))
+    return result
+
+async def create_table(conn):
+    await conn.execute("""
+        CREATE SEQUENCE IF NOT EXISTS sensor_readings_id_seq AS BIGINT
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS sensor_readings (
+            id BIGINT NOT NULL DEFAULT nextval('sensor_readings_id_seq'),
+            sensor_id VARCHAR(100) NOT NULL,
+            temperature FLOAT NOT NULL,
+            humidity FLOAT NOT NULL,
+            vibration FLOAT NOT NULL,
+            load FLOAT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    await conn.execute("""
+        ALTER SEQUENCE sensor_readings_id_seq OWNED BY sensor_readings.id
+    """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS sensor_readings_default PARTITION OF sensor_readings DEFAULT
+    """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sensor_readings_sensor_time
+        ON sensor_readings(sensor_id, timestamp DESC, id DESC)
+    """)
+    await conn.execute("""
+        DROP INDEX IF EXISTS idx_sensor_readings_sensor
+    """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sensor_readings_timestamp ON sensor_readings(timestamp)
+    """)
+
+async def migrate_legacy_table(conn):
+    kind = await conn.fetchval("""
+        SELECT relkind::text FROM pg_class WHERE oid = to_regclass('sensor_readings')
+    """)
+    if kind != "r":
+        return
+
+    # the old heap table becomes one partition holding everything up to the end of its last period
+    await conn.execute("ALTER TABLE sensor_readings RENAME TO sensor_readings_legacy")
+    await conn.execute("ALTER SEQUENCE sensor_readings_id_seq OWNED BY NONE")
+    await conn.execute("ALTER SEQUENCE sensor_readings_id_seq AS BIGINT")
+    await conn.execute("ALTER TABLE sensor_readings_legacy ALTER COLUMN id TYPE BIGINT")
+
+    latest = await conn.fetchval("SELECT MAX(timestamp) FROM sensor_readings_legacy")
+    upper = period_start(latest or datetime.now()) + interval_steps[partition_interval]
+
+    await create_table(conn)
+    await conn.execute(f"""
+        ALTER TABLE sensor_readings ATTACH PARTITION sensor_readings_legacy
+        FOR VALUES FROM (MINVALUE) TO ('{upper.isoformat(sep=' ')}')
+    """)
+
+async def move_from_default(conn, name, bounds, start, upper):
+    # readings that arrived before their period had a partition, e.g. from a gateway whose clock
+    # runs ahead, sit in the default partition and postgres refuses to create a partition they
+    # belong to. the partition is then built on its own, the readings moved over and it is
+    # attached. returns how many moved, None when there was nothing to move.
+    stray = await conn.fetchval("""
+        SELECT EXISTS (SELECT 1 FROM sensor_readings_default WHERE timestamp >= $1 AND timestamp < $2)
+    """, start, upper)
+    if not stray:
+        return None
+
+    await conn.execute(f"CREATE TABLE {name} (LIKE sensor_readings INCLUDING DEFAULTS)")
+    status = await conn.execute(f"""
+        WITH moved AS (
+            DELETE FROM sensor_readings_default WHERE timestamp >= $1 AND timestamp < $2 RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, start, upper)
+    await conn.execute(f"ALTER TABLE sensor_readings ATTACH PARTITION {name} FOR VALUES {bounds}")
+    return int(status.split()[-1])
+
+async def create_partitions(conn, now):
+    step = interval_steps[partition_interval]
+    existing = await list_partitions(conn)
+
+    if retention_hours > 0:
+        start = period_start(now - timedelta(hours=retention_hours))
+    else:
+        start = period_start(now)
+    end = period_start(now) + step * (partition_premake + 1)
+
+    created = []
+    while start < end:
+        upper = start + step
+        overlaps = any(
+            (low is None or low < upper) and (high is None or start < high)
+            for name, low, high in existing
+        )
+        if not overlaps:
+            name = partition_name(start)
+            bounds = f"FROM ('{start.isoformat(sep=' ')}') TO ('{upper.isoformat(sep=' ')}')"
+            try:
+                async with conn.transaction():
+                    moved = await move_from_default(conn, name, bounds, start, upper)
+                    if moved is None:
+                        await conn.execute(f"CREATE TABLE {name} PARTITION OF sensor_readings FOR VALUES {bounds}")
+                if moved:
+                    print(f"moved {moved} readings from the default partition into {name}")
+                created.append(name)
+            except asyncpg.PostgresError as e:
+                print(f"error creating partition {name}: {e}")
+        start = upper
+
+    return created
+
+async def expire_partitions(conn, now):
+    if retention_hours <= 0:
+        return []
+
+    cutoff = now - timedelta(hours=retention_hours)
+    expired = []
+    for name, low, high in await list_partitions(conn):
+        if high is not None and high <= cutoff:
+            if retention_mode == "detach":
+                await conn.execute(f"ALTER TABLE sensor_readings DETACH PARTITION {name}")
+            else:
+                await conn.execute(f"DROP TABLE {name}")
+            expired.append(name)
+
+    await conn.execute("DELETE FROM sensor_readings_default WHERE timestamp < $1", cutoff)
+    return expired
+
+async def setup(conn):
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", lock_key)
+        await migrate_legacy_table(conn)
+        await create_table(conn)
+        await create_partitions(conn, datetime.now())
+
+async def maintain(conn):
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", lock_key)
+        await conn.execute("SET LOCAL lock_timeout = '5s'")
+        now = datetime.now()
+        created = await create_partitions(conn, now)
+        expired = await expire_partitions(conn, now)
+
+    return {"created": created, "expired": expired}
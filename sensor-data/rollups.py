@@ -0,0 +1,146 @@
+import os
+from datetime import datetime, timedelta
+
+# any constant works, it only has to differ from the partition maintenance lock
+lock_key = 7304
+
+minute_retention_hours = int(os.getenv("ROLLUP_MINUTE_RETENTION_HOURS", "48"))
+backfill_days = int(os.getenv("ROLLUP_BACKFILL_DAYS", "31"))
+
+metrics = ["temperature", "humidity", "vibration", "load"]
+aggregates = ["sum", "min", "max", "sumsq"]
+value_columns = [f"{metric}_{aggregate}" for metric in metrics for aggregate in aggregates]
+
+# rollups hold count, sum, min, max and sum of squares of every metric per sensor and bucket.
+# every batch written by store_readings is added in the same transaction as its COPY, so for
+# buckets at or after rollup_state.covered_since the rollups always agree with the raw rows.
+# rows written before the rollups existed have ids below start_id and are folded in an hour
+# at a time by backfill_step, which moves covered_since back as it goes.
+levels = {
+    "minute": ("sensor_rollup_minute", lambda ts: ts.replace(second=0, microsecond=0)),
+    "hour": ("sensor_rollup_hour", lambda ts: ts.replace(minute=0, second=0, microsecond=0))
+}
+
+def upsert_query(table, source):
+    updates = ["count = t.count + EXCLUDED.count"]
+    for column in value_columns:
+        if column.endswith("_min"):
+            updates.append(f"{column} = LEAST(t.{column}, EXCLUDED.{column})")
+        elif column.endswith("_max"):
+            updates.append(f"{column} = GREATEST(t.{column}, EXCLUDED.{column})")
+        else:
+            updates.append(f"{column} = t.{column} + EXCLUDED.{column}")
+    return f"""
+        INSERT INTO {table} AS t (bucket, sensor_id, count, {", ".join(value_columns)})
+        {source}
+        ON CONFLICT (bucket, sensor_id) DO UPDATE SET {", ".join(updates)}
+    """
+
+def unnest_source():
+    types = ["timestamp", "varchar", "bigint"] + ["float8"] * len(value_columns)
+    return f"SELECT * FROM unnest({', '.join(f'${i + 1}::{kind}[]' for i, kind in enumerate(types))})"
+
+def raw_source(unit):
+    selects = []
+    for metric in metrics:
+        selects.extend([f"SUM({metric})", f"MIN({metric})", f"MAX({metric})", f"SUM({metric} * {metric})"])
+    return f"""
+        SELECT date_trunc('{unit}', timestamp), sensor_id, COUNT(*), {", ".join(selects)}
+        FROM sensor_readings
+        WHERE timestamp >= $1 AND timestamp < $2 AND id < $3
+        GROUP BY 1, 2
+        ORDER BY 1, sensor_id COLLATE "C"
+    """
+
+upsert_queries = {unit: upsert_query(table, unnest_source()) for unit, (table, truncate) in levels.items()}
+backfill_queries = {unit: upsert_query(table, raw_source(unit)) for unit, (table, truncate) in levels.items()}
+
+async def create_tables(conn):
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", lock_key)
+        await create_rollup_tables(conn)
+
+async def create_rollup_tables(conn):
+    for unit, (table, truncate) in levels.items():
+        await conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket TIMESTAMP NOT NULL,
+                sensor_id VARCHAR(100) NOT NULL,
+                count BIGINT NOT NULL,
+                {", ".join(f"{column} FLOAT8 NOT NULL" for column in value_columns)},
+                PRIMARY KEY (bucket, sensor_id)
+            )
+        """)
+        await conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_sensor ON {table}(sensor_id, bucket)
+        """)
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            start_id BIGINT NOT NULL,
+            covered_since TIMESTAMP NOT NULL,
+            backfill_until TIMESTAMP NOT NULL,
+            minute_since TIMESTAMP NOT NULL
+        )
+    """)
+    # the current hour is only complete once backfill_step has added its older rows
+    await conn.execute("""
+        INSERT INTO rollup_state (start_id, covered_since, backfill_until, minute_since)
+        SELECT nextval('sensor_readings_id_seq'),
+            date_trunc('hour', now()::timestamp) + interval '1 hour',
+            date_trunc('hour', now()::timestamp) - $1 * interval '1 day',
+            date_trunc('hour', now()::timestamp) - $2 * interval '1 hour'
+        ON CONFLICT (id) DO NOTHING
+    """, backfill_days, minute_retention_hours)
+
+def aggregate(readings, truncate):
+    buckets = {}
+    for data in readings:
+        key = (truncate(data.timestamp), data.sensor_id)
+        values = (data.temperature, data.humidity, data.vibration, data.load)
+        agg = buckets.get(key)
+        if agg is None:
+            agg = buckets[key] = [0] + [0.0, float("inf"), float("-inf"), 0.0] * len(metrics)
+        agg[0] += 1
+        for i, value in enumerate(values):
+            base = 1 + 4 * i
+            agg[base] += value
+            if value < agg[base + 1]:
+                agg[base + 1] = value
+            if value > agg[base + 2]:
+                agg[base + 2] = value
+            agg[base + 3] += value * value
+    return buckets
+
+async def record(conn, readings):
+    # keys are upserted in sorted order, minutes before hours, so concurrent flushes and the
+    # backfill (which orders by the "C" collation, the same as python) lock rows in the same order
+    for unit, (table, truncate) in levels.items():
+        buckets = aggregate(readings, truncate)
+        keys = sorted(buckets)
+        rows = [(bucket, sensor_id, *buckets[(bucket, sensor_id)]) for bucket, sensor_id in keys]
+        await conn.execute(upsert_queries[unit], *[list(column) for column in zip(*rows)])
+
+async def backfill_step(conn):
+    async with conn.transaction():
+        state = await conn.fetchrow("SELECT * FROM rollup_state FOR UPDATE")
+        if state is None or state["covered_since"] <= state["backfill_until"]:
+            return None
+        end = state["covered_since"]
+        start = end - timedelta(hours=1)
+        if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM sensor_readings WHERE timestamp < $1)", end):
+            # nothing older left to fold in
+            await conn.execute("UPDATE rollup_state SET backfill_until = covered_since")
+            return None
+        for unit, (table, truncate) in levels.items():
+            if unit == "minute" and start < state["minute_since"]:
+                continue
+            await conn.execute(backfill_queries[unit], start, end, state["start_id"])
+        await conn.execute("UPDATE rollup_state SET covered_since = $1", start)
+        return start
+
+async def expire_minutes(conn):
+    cutoff = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=minute_retention_hours)
+    async with conn.transaction():
+        await conn.execute("UPDATE rollup_state SET minute_since = GREATEST(minute_since, $1)", cutoff)
+        await conn.execute("DELETE FROM sensor_rollup_minute WHERE bucket < $1", cutoff)